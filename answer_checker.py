@@ -0,0 +1,190 @@
+import enum
+import re
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+import contractions
+
+PRONOUNS = frozenset({"i", "you", "he", "she", "it", "we", "they"})
+# Окончания, отличие в которых — грамматическая ошибка, а не опечатка
+INFLECTION_SUFFIXES = ("s", "es", "ed", "d", "ing")
+
+# Неправильные глаголы (три формы) и служебные слова. Отличие от нужного слова в одну букву,
+# которое даёт другое настоящее слово (wrote/write, than/then), — ошибка, а не опечатка
+IRREGULAR_VERBS = (
+    "be was were been", "become became become", "begin began begun", "break broke broken",
+    "bring brought brought", "build built built", "buy bought bought", "catch caught caught",
+    "choose chose chosen", "come came come", "cost cost cost", "cut cut cut", "do did done",
+    "draw drew drawn", "drink drank drunk", "drive drove driven", "eat ate eaten", "fall fell fallen",
+    "feel felt felt", "find found found", "fly flew flown", "forget forgot forgotten", "get got gotten",
+    "give gave given", "go went gone", "grow grew grown", "have had had", "hear heard heard",
+    "hide hid hidden", "hold held held", "keep kept kept", "know knew known", "leave left left",
+    "lend lent lent", "let let let", "lose lost lost", "make made made", "meet met met", "pay paid paid",
+    "put put put", "read read read", "ride rode ridden", "ring rang rung", "rise rose risen", "run ran run",
+    "say said said", "see saw seen", "sell sold sold", "send sent sent", "set set set", "shake shook shaken",
+    "shine shone shone", "shoot shot shot", "sing sang sung", "sink sank sunk", "sit sat sat",
+    "sleep slept slept", "speak spoke spoken", "spend spent spent", "stand stood stood", "steal stole stolen",
+    "swim swam swum", "take took taken", "teach taught taught", "tell told told", "think thought thought",
+    "throw threw thrown", "understand understood understood", "wake woke woken", "wear wore worn",
+    "win won won", "write wrote written",
+)
+FUNCTION_WORDS = (
+    "a an the this that these those there their they're then than when where were we're what which who "
+    "whom whose why how here her his him he she it its our out your you are am is was been being has have "
+    "had having do does did done can could will would shall should may might must not no nor now new "
+    "and or but if so as at by for from in into of off on onto to too two up with without about after "
+    "before since until while want wont went won't own one any some all each every both either neither "
+    "more most much many less least very just also only even ever never always often well"
+)
+KNOWN_WORDS = frozenset(FUNCTION_WORDS.split()) | frozenset(
+    form for forms in IRREGULAR_VERBS for form in forms.split()
+)
+
+_PUNCTUATION = re.compile(r"[.,!?;:\"]+")
+_WORD = re.compile(r"[a-z]+")
+
+Tokens = Tuple[str, ...]
+
+
+class Verdict(enum.Enum):
+    EXACT = "exact"
+    TYPO = "typo"
+    WRONG = "wrong"
+
+
+class CompiledAnswer(NamedTuple):
+    """Нормализованный правильный ответ и допустимые варианты в виде кортежей слов."""
+    canonical: Tokens
+    variants: frozenset
+    # Настоящие слова: набранное слово из этого множества не может быть опечаткой другого
+    known_words: frozenset = KNOWN_WORDS
+
+
+class CheckResult(NamedTuple):
+    verdict: Verdict
+    # Позиция первого неверного слова (для WRONG) или слова с опечаткой (для TYPO)
+    position: Optional[int] = None
+
+
+def normalize(text: str, expand_all: bool = False) -> Tokens:
+    """Приведение ответа к словам: нижний регистр, раскрытые сокращения, без пунктуации.
+
+    Без expand_all раскрываются только сокращения с апострофом; с ним — и записанные без апострофа (doesnt).
+    """
+    text = text.strip().lower()
+    if expand_all or "'" in text or "’" in text:
+        text = contractions.fix(text.replace("’", "'"))
+    return tuple(_PUNCTUATION.sub(" ", text).split())
+
+
+def _strip_pronoun(tokens: Tokens) -> Tokens:
+    if len(tokens) > 1 and tokens[0] in PRONOUNS:
+        return tokens[1:]
+    return tokens
+
+
+def compile_answer(answer: str, known_words: frozenset = KNOWN_WORDS) -> CompiledAnswer:
+    """Подготовка правильного ответа один раз при загрузке упражнений."""
+    tokens = normalize(answer)
+    canonical = _strip_pronoun(tokens)
+    return CompiledAnswer(canonical=canonical, variants=frozenset({tokens, canonical}), known_words=known_words)
+
+
+def build_known_words(texts: Iterable[str]) -> frozenset:
+    """Словарь настоящих слов: встроенные формы и все слова из текстов упражнений."""
+    words = set(KNOWN_WORDS)
+    for text in texts:
+        for token in normalize(text):
+            words.update(_WORD.findall(token))
+    return frozenset(words)
+
+
+def typo_limit(word: str) -> int:
+    """Допустимое число правок в слове: короткие слова должны совпадать точно."""
+    if len(word) >= 8:
+        return 2
+    if len(word) >= 4:
+        return 1
+    return 0
+
+
+def bounded_distance(a: str, b: str, limit: int) -> int:
+    """Расстояние Левенштейна (с перестановкой соседних букв), ограниченное сверху limit + 1.
+
+    Считается только полоса шириной 2 * limit + 1 вокруг диагонали, поэтому сложность O(len * limit).
+    """
+    too_far = limit + 1
+    if abs(len(a) - len(b)) > limit:
+        return too_far
+    # Общие префикс и суффикс не влияют на расстояние
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    a, b = a[start:end_a], b[start:end_b]
+    if not a or not b:
+        return min(max(len(a), len(b)), too_far)
+
+    previous2: Dict[int, int] = {}
+    previous = {j: j for j in range(min(len(b), limit) + 1)}
+    for i in range(1, len(a) + 1):
+        current = {0: i} if i <= limit else {}
+        row_min = too_far
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            value = min(
+                previous.get(j, too_far) + 1,
+                current.get(j - 1, too_far) + 1,
+                previous.get(j - 1, too_far) + (a[i - 1] != b[j - 1])
+            )
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous2.get(j - 2, too_far) + 1)
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return too_far
+        previous2, previous = previous, current
+    return min(previous.get(len(b), too_far), too_far)
+
+
+def _is_inflection(a: str, b: str) -> bool:
+    short, long = (a, b) if len(a) <= len(b) else (b, a)
+    return long.startswith(short) and long[len(short):] in INFLECTION_SUFFIXES
+
+
+def _compare(user: Tokens, expected: Tokens, known_words: frozenset) -> CheckResult:
+    if len(user) != len(expected):
+        return CheckResult(Verdict.WRONG, min(len(user), len(expected)))
+    typo_position = None
+    for position, (word, correct) in enumerate(zip(user, expected)):
+        if word == correct:
+            continue
+        limit = typo_limit(correct)
+        if word in known_words or _is_inflection(word, correct) or bounded_distance(word, correct, limit) > limit:
+            return CheckResult(Verdict.WRONG, position)
+        if typo_position is None:
+            typo_position = position
+    if typo_position is None:
+        return CheckResult(Verdict.EXACT)
+    return CheckResult(Verdict.TYPO, typo_position)
+
+
+def check(compiled: CompiledAnswer, text: str) -> CheckResult:
+    """Проверка ответа пользователя: точное совпадение, опечатка или неверное слово."""
+    tokens = normalize(text)
+    if tokens in compiled.variants or _strip_pronoun(tokens) in compiled.variants:
+        return CheckResult(Verdict.EXACT)
+    words = _strip_pronoun(tokens)
+    result = _compare(words, compiled.canonical, compiled.known_words)
+    if result.verdict is not Verdict.WRONG:
+        return result
+    # Сокращение без апострофа (doesnt): после раскрытия ответ сравнивается заново, опечатка — в самом сокращении
+    expanded = _strip_pronoun(normalize(text, expand_all=True))
+    if expanded == words:
+        return result
+    relaxed = _compare(expanded, compiled.canonical, compiled.known_words)
+    if relaxed.verdict is Verdict.WRONG:
+        return result
+    return CheckResult(Verdict.TYPO, next(i for i, (a, b) in enumerate(zip(words, expanded)) if a != b))
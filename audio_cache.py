@@ -0,0 +1,103 @@
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AudioCache:
+    """Дисковый кэш аудио с адресацией по содержимому и вытеснением LRU."""
+
+    def __init__(self, directory: str, max_bytes: int, suffix: str = ".mp3") -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._rebuild_index()
+
+    @staticmethod
+    def make_key(model: str, voice: str, text: str) -> str:
+        """Ключ кэша: хэш от модели, голоса и текста."""
+        return hashlib.sha256(f"{model}\0{voice}\0{text}".encode('utf-8')).hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}{self.suffix}"
+
+    def _rebuild_index(self) -> None:
+        """Восстановление индекса по файлам на диске (от давно использованных к недавним)."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for path in self.directory.iterdir():
+            if path.suffix == ".tmp":
+                path.unlink(missing_ok=True)
+            elif path.suffix == self.suffix:
+                stat = path.stat()
+                entries.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+        self._evict()
+        logger.info(f"Audio cache loaded: {len(self._index)} files, {self._total_bytes} bytes")
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Получение аудио из кэша, None при промахе."""
+        if key not in self._index:
+            self.misses += 1
+            return None
+        path = self.path(key)
+        try:
+            data = await asyncio.to_thread(path.read_bytes)
+            # mtime служит отметкой последнего использования при перестроении индекса
+            await asyncio.to_thread(os.utime, path)
+        except FileNotFoundError:
+            self._forget(key)
+            self.misses += 1
+            return None
+        self._index.move_to_end(key)
+        self.hits += 1
+        return data
+
+    async def put(self, key: str, data: bytes) -> None:
+        """Сохранение аудио в кэш с атомарной записью файла."""
+        if not data or len(data) > self.max_bytes:
+            return
+        path = self.path(key)
+        # Уникальный временный файл на каждую запись, чтобы параллельные запросы не мешали друг другу
+        tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            await asyncio.to_thread(tmp_path.write_bytes, data)
+            await asyncio.to_thread(os.replace, tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        self._forget(key)
+        self._index[key] = len(data)
+        self._total_bytes += len(data)
+        self._evict()
+
+    def _forget(self, key: str) -> None:
+        size = self._index.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self) -> None:
+        """Удаление давно не использованных файлов сверх лимита размера."""
+        while self._total_bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            self.path(key).unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "files": len(self._index),
+            "bytes": self._total_bytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
@@ -0,0 +1,89 @@
+"""Проверка ответов на упражнения: answer_checker.check по сравнению с прежним сравнением через difflib.
+
+Запуск из корня репозитория: python -m benchmarks.answer_checker [--rounds 20]
+Для каждого упражнения проверяются правильный ответ, ответ с опечаткой и неверный ответ.
+"""
+import argparse
+import difflib
+import random
+import time
+from typing import Callable, List, Tuple
+
+import contractions
+
+import answer_checker
+import config
+import content
+
+PRONOUNS = ["i", "you", "he", "she", "it", "we", "they"]
+
+
+def difflib_check(correct_answer: str, text: str) -> bool:
+    """Прежняя проверка из handle_practice_message: раскрытие сокращений при каждом ответе и SequenceMatcher."""
+    correct_words = contractions.fix(correct_answer.strip().lower()).split()
+    user_words = contractions.fix(text.strip().lower()).split()
+    if user_words and user_words[0] in PRONOUNS:
+        user_words = user_words[1:]
+    if correct_words and correct_words[0] in PRONOUNS:
+        correct_words = correct_words[1:]
+    correct_normalized = " ".join(correct_words)
+    text_normalized = " ".join(user_words)
+    return (text_normalized == correct_normalized
+            or difflib.SequenceMatcher(None, text_normalized, correct_normalized).ratio() > 0.9)
+
+
+KINDS = ("correct", "typo", "wrong")
+
+
+def answers(exercises: List[content.Exercise], rng: random.Random) -> List[Tuple[str, content.Exercise, str]]:
+    """Правильный ответ, ответ с переставленными буквами в самом длинном слове и ответ с лишним словом."""
+    cases = []
+    for exercise in exercises:
+        words = exercise.answer.split()
+        longest = max(range(len(words)), key=lambda index: len(words[index]))
+        word = words[longest]
+        position = rng.randrange(max(len(word) - 1, 1))
+        typo = word[:position] + word[position + 1:position + 2] + word[position:position + 1] + word[position + 2:]
+        cases.append(("correct", exercise, exercise.answer))
+        cases.append(("typo", exercise, " ".join(words[:longest] + [typo] + words[longest + 1:])))
+        cases.append(("wrong", exercise, " ".join(words + ["not"])))
+    return cases
+
+
+def measure(name: str, cases: List[Tuple[str, content.Exercise, str]], rounds: int,
+            run: Callable[[content.Exercise, str], object]) -> float:
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _, exercise, text in cases:
+            run(exercise, text)
+        timings.append((time.perf_counter() - started) / len(cases))
+    per_answer = sorted(timings)[len(timings) // 2] * 1e6
+    print(f"{name:<14} {per_answer:8.1f} us per answer ({len(cases)} answers x {rounds} rounds)")
+    return per_answer
+
+
+def main(rounds: int, seed: int) -> None:
+    grammar_exercises = content.load_grammar_exercises(config.GRAMMAR_EXERCISES_FILE)
+    exercises = [exercise for rules in grammar_exercises.values()
+                 for items in rules.values() for exercise in items]
+    cases = answers(exercises, random.Random(seed))
+    old = measure("difflib", cases, rounds, lambda exercise, text: difflib_check(exercise.answer, text))
+    new = measure("answer_checker", cases, rounds,
+                  lambda exercise, text: answer_checker.check(exercise.compiled, text))
+    print(f"speedup {old / new:.1f}x")
+
+    for kind in KINDS:
+        selected = [(exercise, text) for case_kind, exercise, text in cases if case_kind == kind]
+        accepted_old = sum(difflib_check(exercise.answer, text) for exercise, text in selected)
+        accepted_new = sum(answer_checker.check(exercise.compiled, text).verdict is not answer_checker.Verdict.WRONG
+                           for exercise, text in selected)
+        print(f"{kind:<8} accepted: difflib {accepted_old}, answer_checker {accepted_new} of {len(selected)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    main(args.rounds, args.seed)
@@ -0,0 +1,79 @@
+"""Задержка операций FSM в SQLiteStorage по сравнению с MemoryStorage.
+
+Запуск из корня репозитория: python -m benchmarks.fsm_storage [--chats 1000]
+Каждый чат проходит шаги практики: set_state, несколько update_data и get_data, как send_practice_exercise.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import MetaData
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from fsm_storage import SQLiteStorage
+
+
+async def practice_steps(storage: BaseStorage, chat_id: int, steps: int, latencies: Dict[str, List[float]]) -> None:
+    key = StorageKey(bot_id=1, chat_id=chat_id, user_id=chat_id)
+    for index in range(steps):
+        for operation, call in (
+            ("set_state", lambda: storage.set_state(key, "PracticeState:answering")),
+            ("update_data", lambda: storage.update_data(key, {"exercise_index": index})),
+            ("update_data", lambda: storage.update_data(key, {"current_exercise": {"question": "q", "answer": "a"}})),
+            ("get_data", lambda: storage.get_data(key))
+        ):
+            started = time.perf_counter()
+            await call()
+            # Первое обращение к чату читает базу данных, все чаты начинают одновременно
+            name = "first call" if index == 0 and operation == "set_state" else operation
+            latencies.setdefault(name, []).append(time.perf_counter() - started)
+        # Пауза между ответами пользователя, за неё буфер успевает записаться
+        await asyncio.sleep(0.01)
+
+
+async def measure(storage: BaseStorage, chats: int, steps: int) -> Dict[str, List[float]]:
+    latencies: Dict[str, List[float]] = {}
+    await asyncio.gather(*(practice_steps(storage, chat_id, steps, latencies) for chat_id in range(chats)))
+    await storage.close()
+    return latencies
+
+
+def report(name: str, latencies: Dict[str, List[float]]) -> None:
+    for operation, values in sorted(latencies.items()):
+        values.sort()
+        p50 = values[len(values) // 2] * 1e6
+        p99 = values[int(len(values) * 0.99)] * 1e6
+        print(f"{name:<8} {operation:<12} p50 {p50:8.1f} us   p99 {p99:8.1f} us   ({len(values)} calls)")
+
+
+async def main(chats: int, steps: int) -> None:
+    report("memory", await measure(MemoryStorage(), chats, steps))
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}")
+        metadata = MetaData()
+        storage = SQLiteStorage(engine, metadata)
+        async with engine.begin() as connection:
+            await connection.run_sync(metadata.create_all)
+        report("sqlite", await measure(storage, chats, steps))
+        # Первое обращение к чату после перезапуска читает запись из базы данных
+        restarted = SQLiteStorage(engine, MetaData())
+        cold = []
+        for chat_id in range(chats):
+            started = time.perf_counter()
+            await restarted.get_data(StorageKey(bot_id=1, chat_id=chat_id, user_id=chat_id))
+            cold.append(time.perf_counter() - started)
+        report("restart", {"get_data": cold})
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--steps", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.chats, args.steps))
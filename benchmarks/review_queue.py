@@ -0,0 +1,105 @@
+"""Выбор слова для повторения и оценка ответа на очередях повторений 100 тысяч пользователей.
+
+Запуск из корня репозитория: python -m benchmarks.review_queue [--users 100000]
+Большинство пользователей повторяет десятки слов, HEAVY_SHARE пользователей — тысячи.
+Замеряются bot.pick_review_word и bot.grade_word на отдельной базе данных; каждый десятый замер — на пользователе с тысячами слов.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from typing import List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import bot
+import migrations
+import models
+
+DICTIONARY_SIZE = 5000
+HEAVY_SHARE = 0.01
+HEAVY_WORDS = 3000
+
+
+def fill(path: str, users: int, seed: int) -> Tuple[int, List[int]]:
+    """Очереди повторений со сроками в пределах месяца до и после текущего момента."""
+    rng = random.Random(seed)
+    now = int(time.time())
+    connection = sqlite3.connect(path)
+    connection.executemany(
+        "INSERT INTO dictionaries (id, level, word, definition, translation) VALUES (?, 'A1-A2', ?, '', '')",
+        ((word_id, f"Word{word_id}") for word_id in range(1, DICTIONARY_SIZE + 1))
+    )
+    rows = 0
+    heavy_users = []
+    for user_id in range(1, users + 1):
+        count = rng.randint(5, 60)
+        if rng.random() < HEAVY_SHARE:
+            count = HEAVY_WORDS
+            heavy_users.append(user_id)
+        words = rng.sample(range(1, DICTIONARY_SIZE + 1), count)
+        connection.executemany(
+            "INSERT INTO word_reviews (user_id, word_id, repetitions, interval_days, ease, due_at) "
+            "VALUES (?, ?, 1, 1.0, 2.5, ?)",
+            ((user_id, word_id, now + rng.randint(-30, 30) * 86400) for word_id in words)
+        )
+        rows += count
+    connection.commit()
+    connection.execute("ANALYZE")
+    connection.close()
+    return rows, heavy_users
+
+
+def report(name: str, values: List[float]) -> None:
+    values.sort()
+    p50 = values[len(values) // 2] * 1e3
+    p99 = values[int(len(values) * 0.99)] * 1e3
+    print(f"{name:<18} p50 {p50:6.2f} ms   p99 {p99:6.2f} ms   ({len(values)} calls)")
+
+
+async def main(users: int, samples: int, seed: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        await migrations.migrate(engine, models.Base.metadata)
+        started = time.perf_counter()
+        rows, heavy_users = fill(path, users, seed)
+        print(f"{users} users, {rows} reviews, filled in {time.perf_counter() - started:.1f}s")
+
+        bot.SessionLocal.configure(bind=engine)
+        async with engine.connect() as connection:
+            plan = await connection.execute(text("EXPLAIN QUERY PLAN " + str(
+                models.due_review_query(1, 0).compile(compile_kwargs={"literal_binds": True})
+            )))
+            print("plan:", "; ".join(row[-1] for row in plan))
+
+        rng = random.Random(seed + 1)
+        picks, heavy_picks, grades = [], [], []
+        for sample in range(samples):
+            heavy = heavy_users and sample % 10 == 0
+            user_id = rng.choice(heavy_users) if heavy else rng.randint(1, users)
+            started = time.perf_counter()
+            entry = await bot.pick_review_word(user_id, 'A1-A2')
+            (heavy_picks if heavy else picks).append(time.perf_counter() - started)
+            if entry is None:
+                continue
+            started = time.perf_counter()
+            await bot.grade_word(user_id, entry[0], rng.random() < 0.8)
+            grades.append(time.perf_counter() - started)
+        report("pick_review_word", picks)
+        report(f"  {HEAVY_WORDS} words", heavy_picks)
+        report("grade_word", grades)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.samples, args.seed))
@@ -1,31 +1,51 @@
 import asyncio
-import difflib
 import logging
 import random
-import json
-from datetime import datetime, timedelta
+import re
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from contextlib import asynccontextmanager
 from typing import Optional, Dict, List, Tuple
 
-import contractions
-import openai
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.client.default import DefaultBotProperties
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import StateFilter, CommandStart, Command
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup, \
-    FSInputFile
+    FSInputFile, BufferedInputFile, InputMediaPhoto
 from aiogram import Router
 from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import BaseStorage
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import declarative_base
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.future import select
-from sqlalchemy import Column, String, Integer, Text, ForeignKey, and_
 from sqlalchemy.orm import sessionmaker
 
+import answer_checker
 import config
+import content
+import context_builder
+import gateway
+import migrations
+import srs
+import streaming
+import webhook
+from outbox import Outbox, bulk
+from audio_cache import AudioCache
+from callbacks import DAYS, DayCallback, days_from_mask, GrammarRuleCallback, LearnWordCallback, ListenWordCallback, \
+    PracticeRuleCallback
+from fsm_storage import SQLiteStorage
+from shared_state import create_shared_state
+from middlewares import ChatLockMiddleware, CurrentUserMiddleware
+from models import Base, User, UserHistory, UserSummary, Dictionary, WordReview, Setting, TelegramFile, \
+    due_reminders_query, due_review_query, dictionary_word_query, recent_history_query, toggle_day_statement, \
+    trim_history_statement, user_by_chat_query
+from word_pool import WordPool
 from buttons import *
 
 # Настройка логирования
@@ -46,9 +66,9 @@ SessionLocal = sessionmaker(
     bind=engine,
     class_=AsyncSession,
     autocommit=False,
-    autoflush=False
+    autoflush=False,
+    expire_on_commit=False
 )
-Base = declarative_base()
 
 # Асинхронный менеджер контекста для работы с сессией базы данных
 @asynccontextmanager
@@ -65,194 +85,370 @@ async def session_scope() -> AsyncSession:
         await session.close()
 
 # Кэширование озвучки
-speech_cache = {}
+audio_cache = AudioCache(config.AUDIO_CACHE_DIR, config.AUDIO_CACHE_MAX_BYTES)
 
-async def generate_speech(word: str) -> str:
-    """Генерация озвучки для слова с использованием OpenAI, с кэшированием."""
-    if word in speech_cache:
-        return speech_cache[word]
-
-    speech_file_path = Path(f"speech_{word}.mp3")
-    try:
-        with client.audio.speech.with_streaming_response.create(
-                model="tts-1-hd",
-                voice="alloy",
-                input=word
-        ) as response:
-            response.stream_to_file(speech_file_path)
-        speech_cache[word] = speech_file_path
-    finally:
-        if not speech_file_path.exists():
-            speech_file_path.unlink()
-    return speech_cache[word]
-
-# Модели базы данных
-class User(Base):
-    __tablename__ = "users"
-    id = Column(Integer, primary_key=True, index=True)
-    chat_id = Column(Integer, unique=True, index=True)
-    level = Column(String, index=True)
-    notification_time = Column(String)
-    notification_days = Column(Text)
-    language = Column(String, default='en')
-    chosen_character = Column(String, default='Lori')
-
-class UserHistory(Base):
-    __tablename__ = "user_histories"
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey('users.id'))
-    role = Column(String)
-    content = Column(Text)
-
-class Dictionary(Base):
-    __tablename__ = "dictionaries"
-    id = Column(Integer, primary_key=True, index=True)
-    level = Column(String, index=True)
-    word = Column(String, index=True)
-    definition = Column(Text)
-    translation = Column(Text)
-
-class GrammarExercise(Base):
-    __tablename__ = "grammar_exercises"
-    id = Column(Integer, primary_key=True, index=True)
-    level = Column(String, index=True)
-    rule_name = Column(String, index=True)
-    question = Column(Text)
-    answer = Column(Text)
+async def synthesize_cached(text: str, voice: str) -> bytes:
+    """Генерация озвучки с использованием дискового кэша."""
+    key = AudioCache.make_key(config.TTS_MODEL, voice, text)
+    audio = await audio_cache.get(key)
+    if audio is None:
+        audio = await gateway.synthesize_speech(text, voice)
+        await audio_cache.put(key, audio)
+    return audio
 
 async def create_db() -> None:
-    """Создание всех таблиц в базе данных."""
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    """Создание и обновление схемы базы данных до последней версии."""
+    await migrations.migrate(engine, Base.metadata)
+
+async def get_setting(session: AsyncSession, key: str) -> Optional[str]:
+    setting = await session.get(Setting, key)
+    return setting.value if setting else None
 
-client = openai.OpenAI(api_key=config.PROXY_API_KEY, base_url="https://api.proxyapi.ru/openai/v1")
+async def set_setting(session: AsyncSession, key: str, value: str) -> None:
+    await session.merge(Setting(key=key, value=value))
 
 # Настройка бота, диспетчера и планировщика
 bot = Bot(token=config.TELEGRAM_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-dp = Dispatcher()
+# Все исходящие запросы в чаты проходят через очередь с лимитами Telegram
+outbox = Outbox(config.OUTBOX_GLOBAL_RATE, config.OUTBOX_CHAT_RATE, config.OUTBOX_CHAT_BURST, config.OUTBOX_MAX_RETRIES,
+                config.OUTBOX_FLOOD_CHATS, config.OUTBOX_FLOOD_WINDOW)
+bot.session.middleware(outbox)
+def create_fsm_storage() -> BaseStorage:
+    """Состояния FSM в Redis при работе нескольких процессов, иначе в базе данных бота."""
+    if config.REDIS_URL:
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(config.REDIS_URL)
+    return SQLiteStorage(engine, Base.metadata, config.FSM_FLUSH_DELAY, config.FSM_CACHE_SIZE)
+
+dp = Dispatcher(storage=create_fsm_storage())
 router = Router()
 scheduler = AsyncIOScheduler()
 
-# Загрузка конфигураций из JSON
-def load_configurations():
-    with open('configurations.json', 'r', encoding='utf-8') as f:
-        return json.load(f)
+# Контент бота из предкомпилированного пакета (подменяется на лету при изменении исходных файлов)
+content_registry = content.ContentRegistry()
 
-configurations = load_configurations()
+""" Кэш file_id загруженных в Telegram файлов """
 
-LEVEL_MAPPING = configurations['LEVEL_MAPPING']
-GREETINGS = configurations['GREETINGS']
-REMINDER_MESSAGES = configurations['REMINDER_MESSAGES']
+file_ids: Dict[str, str] = {}
+# file_id, полученные другими процессами бота
+shared_state = create_shared_state(config.REDIS_URL, config.SHARED_STATE_PREFIX)
+
+async def load_file_ids() -> None:
+    """Загрузка сохранённых file_id из базы данных."""
+    async with session_scope() as session:
+        result = await session.execute(select(TelegramFile.key, TelegramFile.file_id))
+        file_ids.update(dict(result.all()))
+    logger.info(f"Loaded {len(file_ids)} Telegram file ids")
+
+async def get_file_id(key: str) -> Optional[str]:
+    """file_id из памяти процесса или из общего состояния."""
+    file_id = file_ids.get(key)
+    if file_id is None:
+        file_id = await shared_state.get(f"file_id:{key}")
+        if file_id is not None:
+            file_ids[key] = file_id
+    return file_id
+
+async def remember_file_id(key: str, file_id: str) -> None:
+    """Сохранение file_id, полученного после первой загрузки файла."""
+    if file_ids.get(key) == file_id:
+        return
+    file_ids[key] = file_id
+    await shared_state.set(f"file_id:{key}", file_id)
+    async with session_scope() as session:
+        await session.merge(TelegramFile(key=key, file_id=file_id))
+
+async def forget_file_id(key: str) -> None:
+    """Удаление недействительного file_id."""
+    file_ids.pop(key, None)
+    await shared_state.delete(f"file_id:{key}")
+    async with session_scope() as session:
+        await session.execute(TelegramFile.__table__.delete().where(TelegramFile.key == key))
+
+def asset_key(path: str) -> str:
+    """Ключ локального файла; меняется при изменении файла."""
+    return f"asset:{path}:{int(Path(path).stat().st_mtime)}"
+
+async def send_character_photo(chat_id: int, character: str) -> None:
+    """Отправка изображения персонажа с повторным использованием file_id."""
+    path = config.CHARACTER_IMAGES[character]
+    key = asset_key(path)
+    caption = f"{character} is ready to chat with you!"
+    file_id = await get_file_id(key)
+    if file_id:
+        try:
+            await bot.send_photo(chat_id, file_id, caption=caption)
+            return
+        except TelegramBadRequest:
+            await forget_file_id(key)
+    message = await bot.send_photo(chat_id, FSInputFile(path), caption=caption)
+    await remember_file_id(key, message.photo[-1].file_id)
+
+async def send_character_gallery(chat_id: int) -> None:
+    """Отправка изображений всех персонажей одним альбомом."""
+    keys = [asset_key(path) for path in config.CHARACTER_IMAGES.values()]
+    known_file_ids = [await get_file_id(key) for key in keys]
+    media = [
+        InputMediaPhoto(media=file_id or FSInputFile(path), caption=f"{character} is ready to chat with you!")
+        for file_id, (character, path) in zip(known_file_ids, config.CHARACTER_IMAGES.items())
+    ]
+    try:
+        messages = await bot.send_media_group(chat_id, media)
+    except TelegramBadRequest:
+        if not any(known_file_ids):
+            raise
+        for key in keys:
+            await forget_file_id(key)
+        await send_character_gallery(chat_id)
+        return
+    for key, sent in zip(keys, messages):
+        await remember_file_id(key, sent.photo[-1].file_id)
+
+async def send_cached_voice(chat_id: int, text: str, voice: str, filename: str = "speech.mp3") -> None:
+    """Отправка озвучки из кэша; повторные отправки используют file_id без загрузки файла."""
+    key = f"voice:{AudioCache.make_key(config.TTS_MODEL, voice, text)}"
+    file_id = await get_file_id(key)
+    if file_id:
+        try:
+            await bot.send_voice(chat_id, file_id)
+            return
+        except TelegramBadRequest:
+            await forget_file_id(key)
+    audio = await synthesize_cached(text, voice)
+    message = await bot.send_voice(chat_id, BufferedInputFile(audio, filename=filename))
+    await remember_file_id(key, message.voice.file_id)
 
 async def get_user(session: AsyncSession, chat_id: int) -> Optional[User]:
     """Получение пользователя по chat_id из базы данных."""
     try:
-        result = await session.execute(select(User).filter(User.chat_id == chat_id))
+        result = await session.execute(user_by_chat_query(chat_id))
         return result.scalars().first()
     except Exception as e:
         logger.error(f"Error fetching user: {e}")
         return None
 
-async def get_user_history(session: AsyncSession, user_id: int) -> List[UserHistory]:
-    """Получение истории пользователя по user_id."""
+async def load_user(chat_id: int) -> Optional[User]:
+    """Загрузка пользователя в отдельной сессии."""
+    async with session_scope() as session:
+        return await get_user(session, chat_id)
+
+# Кэши в памяти процесса (пользователи, история разговора) не видят изменений из других процессов,
+# поэтому при общем состоянии в Redis, когда процессов несколько, они отключаются
+LOCAL_CACHES = not config.REDIS_URL
+
+# Пользователь загружается один раз на обновление и передаётся в обработчики как аргумент user
+user_context = CurrentUserMiddleware(load_user, config.USER_CACHE_TTL if LOCAL_CACHES else 0)
+# Блокировка чата берётся до загрузки пользователя, чтобы обработчик видел результат предыдущего обновления
+dp.update.outer_middleware(ChatLockMiddleware())
+dp.update.outer_middleware(user_context)
+
+# Максимальное число сообщений в истории пользователя (пары вопрос-ответ)
+HISTORY_LIMIT = config.MAX_HISTORY_LENGTH * 2
+
+# Кэш последних сообщений пользователей со сквозной записью
+history_cache: "OrderedDict[int, deque]" = OrderedDict()
+
+def cache_history(user_id: int, history: List[Dict[str, str]]) -> None:
+    """Сохранение истории пользователя в кэше с вытеснением давно неактивных пользователей."""
+    if not config.HISTORY_CACHE_USERS or not LOCAL_CACHES:
+        return
+    history_cache[user_id] = deque(history, maxlen=HISTORY_LIMIT)
+    history_cache.move_to_end(user_id)
+    while len(history_cache) > config.HISTORY_CACHE_USERS:
+        history_cache.popitem(last=False)
+
+async def get_user_history(session: AsyncSession, user_id: int) -> List[Dict[str, str]]:
+    """Получение последних сообщений истории пользователя по user_id."""
+    if user_id in history_cache:
+        history_cache.move_to_end(user_id)
+        return list(history_cache[user_id])
     try:
-        result = await session.execute(select(UserHistory).filter(UserHistory.user_id == user_id).order_by(UserHistory.id))
-        return result.scalars().all()
+        result = await session.execute(recent_history_query(user_id, HISTORY_LIMIT))
+        history = [{"role": role, "content": content} for role, content in reversed(result.all())]
+        cache_history(user_id, history)
+        return history
     except Exception as e:
         logger.error(f"Error fetching user history: {e}")
         return []
 
-async def save_user_history(session: AsyncSession, user_id: int, history: List[UserHistory]) -> None:
-    """Сохранение истории пользователя."""
+async def trim_user_history(session: AsyncSession, user_id: int, keep: int = HISTORY_LIMIT) -> List[Dict[str, str]]:
+    """Удаление сообщений сверх последних keep одним запросом DELETE, возвращает удалённые сообщения."""
+    result = await session.execute(trim_history_statement(user_id, keep))
+    return [{"role": role, "content": content} for _, role, content in sorted(result.all())]
+
+async def add_to_history(session: AsyncSession, user_id: int, role: str, message: str) -> List[Dict[str, str]]:
+    """Добавление записи в историю пользователя, возвращает вытесненные из истории сообщения."""
     try:
-        await session.execute(UserHistory.__table__.delete().where(UserHistory.user_id == user_id))
-        for entry in history:
-            new_entry = UserHistory(user_id=user_id, role=entry.role, content=entry.content)
-            session.add(new_entry)
+        session.add(UserHistory(user_id=user_id, role=role, content=message))
+        await session.flush()
+        evicted = await trim_user_history(session, user_id)
         await session.commit()
+        if user_id in history_cache:
+            history_cache[user_id].append({"role": role, "content": message})
+        return evicted
     except Exception as e:
-        logger.error(f"Error saving user history: {e}")
+        logger.error(f"Error adding to history: {e}")
         await session.rollback()
+        history_cache.pop(user_id, None)
+        return []
 
-async def add_to_history(session: AsyncSession, user_id: int, role: str, message: str) -> None:
-    """Добавление записи в историю пользователя."""
+async def trim_history_to_budget(session: AsyncSession, user_id: int, chosen_character: str,
+                                 user_level: Optional[str]) -> List[Dict[str, str]]:
+    """Удаление старых ходов, которые не помещаются в бюджет токенов контекста, возвращает удалённые сообщения.
+
+    Так в истории остаётся ровно то, что получит модель, а всё вытесненное попадает в краткое содержание.
+    """
     try:
         history = await get_user_history(session, user_id)
-
-        if len(history) >= config.MAX_HISTORY_LENGTH * 2:
-            history = history[2:]
-
-        new_entry = UserHistory(user_id=user_id, role=role, content=message)
-        session.add(new_entry)
+        summary = await get_history_summary(session, user_id)
+        dropped = context_builder.overflow(
+            chosen_character, user_level or "A1", history, summary, config.CONTEXT_TOKEN_BUDGET
+        )
+        if not dropped:
+            return []
+        evicted = await trim_user_history(session, user_id, keep=len(history) - dropped)
         await session.commit()
+        if user_id in history_cache:
+            cache_history(user_id, history[dropped:])
+        return evicted
     except Exception as e:
-        logger.error(f"Error adding to history: {e}")
+        logger.error(f"Error trimming history to the token budget: {e}")
         await session.rollback()
+        history_cache.pop(user_id, None)
+        return []
 
-async def load_dictionary_into_db(dictionary_data: Dict[str, Dict[str, Dict[str, str]]], session: AsyncSession) -> None:
-    """Загрузка словаря в базу данных."""
+async def get_history_summary(session: AsyncSession, user_id: int) -> Optional[str]:
+    """Получение краткого содержания ранней части разговора."""
+    summary = await session.get(UserSummary, user_id)
+    return summary.content if summary else None
+
+async def update_history_summary(user_id: int, evicted: List[Dict[str, str]],
+                                 previous: Optional[asyncio.Task] = None) -> None:
+    """Добавление вытесненных из истории сообщений в краткое содержание разговора."""
+    if previous is not None:
+        # Обновления одного пользователя идут по очереди: иначе позднее обновление затёрло бы более раннее
+        await asyncio.gather(previous, return_exceptions=True)
     try:
-        for level, words in dictionary_data.items():
-            for word, info in words.items():
-                existing_word = await session.execute(
-                    select(Dictionary).filter_by(level=level, word=word.capitalize())
-                )
-                if not existing_word.scalars().first():
-                    new_word = Dictionary(
-                        level=level,
-                        word=word.capitalize(),
-                        definition=info['definition'],
-                        translation=info['translation']
-                    )
-                    session.add(new_word)
-        await session.commit()
+        async with session_scope() as session:
+            summary = await get_history_summary(session, user_id)
+        content = await gateway.complete_chat(
+            context_builder.summary_request(summary, evicted, config.SUMMARY_MAX_WORDS)
+        )
+        async with session_scope() as session:
+            await session.merge(UserSummary(user_id=user_id, content=content))
     except Exception as e:
-        logger.error(f"Error loading dictionary into DB: {e}")
-        await session.rollback()
+        logger.error(f"Error updating history summary: {e}")
 
-async def remove_duplicates_from_db(session: AsyncSession) -> None:
-    """Удаление дубликатов из базы данных."""
+background_tasks = set()
+# Последнее запущенное обновление краткого содержания каждого пользователя
+summary_tasks: Dict[int, asyncio.Task] = {}
+
+def summarize_in_background(user_id: int, evicted: List[Dict[str, str]]) -> None:
+    """Запуск обновления краткого содержания без ожидания результата, после предыдущего обновления пользователя."""
+    if not evicted or not config.HISTORY_SUMMARY_ENABLED:
+        return
+    task = asyncio.create_task(update_history_summary(user_id, evicted, summary_tasks.get(user_id)))
+    summary_tasks[user_id] = task
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    task.add_done_callback(lambda done: summary_tasks.pop(user_id) if summary_tasks.get(user_id) is done else None)
+
+async def load_dictionary_into_db(dictionary_data: Dict[str, Dict[str, Dict[str, str]]], session: AsyncSession) -> bool:
+    """Загрузка словаря в базу данных одним пакетным INSERT на уровень."""
     try:
-        words_seen = set()
-        duplicates = await session.execute(select(Dictionary))
-        for entry in duplicates.scalars().all():
-            word_key = (entry.level, entry.word)
-            if word_key in words_seen:
-                await session.delete(entry)
-            else:
-                words_seen.add(word_key)
+        statement = sqlite_insert(Dictionary).on_conflict_do_nothing(index_elements=['level', 'word'])
+        for level, words in dictionary_data.items():
+            rows = [
+                {
+                    "level": level,
+                    "word": word.capitalize(),
+                    "definition": info['definition'],
+                    "translation": info['translation']
+                }
+                for word, info in words.items()
+            ]
+            if rows:
+                await session.execute(statement, rows)
         await session.commit()
+        return True
     except Exception as e:
-        logger.error(f"Error removing duplicates from DB: {e}")
+        logger.error(f"Error loading dictionary into DB: {e}")
         await session.rollback()
+        return False
 
 """ Функции для работы с уведомлениями """
 
-async def schedule_notifications(chat_id: int, days: List[str], time: str, language: str = 'en') -> None:
-    """Планирование уведомлений для пользователя."""
-    hours, minutes = map(int, time.split(":"))
-    job_id = f"notification_{chat_id}"
-
-    existing_jobs = scheduler.get_jobs()
-    for job in existing_jobs:
-        if job.id.startswith(job_id):
-            scheduler.remove_job(job.id)
-
-    for day in days:
-        try:
-            scheduler.add_job(send_reminder, 'cron', day_of_week=day, hour=hours, minute=minutes, id=f"{job_id}_{day}",
-                              args=[chat_id, language])
-        except Exception as e:
-            logger.error(f"Error scheduling notification for {day}: {e}")
-            await bot.send_message(chat_id, f"Failed to schedule notification for {day.capitalize()}.")
-
-    if not scheduler.running:
-        scheduler.start()
+async def find_due_reminders(ticks: List[datetime]) -> List[Tuple[int, str]]:
+    """Пользователи, которым нужно отправить напоминание в минуты ticks (UTC), одним запросом по индексу."""
+    # Время уведомления хранится в минутах от полуночи UTC, а дни недели выбираются по московскому времени
+    minutes_by_day: Dict[int, List[int]] = {}
+    for tick in ticks:
+        day = (tick + timedelta(hours=config.NOTIFICATION_UTC_OFFSET)).weekday()
+        minutes_by_day.setdefault(day, []).append(tick.hour * 60 + tick.minute)
+    async with engine.connect() as connection:
+        result = await connection.execute(due_reminders_query(minutes_by_day))
+        return [(chat_id, language or 'en') for chat_id, language in result]
 
 async def send_reminder(chat_id: int, language: str) -> None:
     """Отправка уведомления пользователю."""
-    reminder_messages_local = REMINDER_MESSAGES.get(language, REMINDER_MESSAGES['en'])
-    await bot.send_message(chat_id, random.choice(reminder_messages_local))
+    reminder_messages = content_registry.reminder_messages
+    reminder_messages_local = reminder_messages.get(language, reminder_messages['en'])
+    try:
+        # Рассылка уступает очередь ответам пользователям
+        with bulk():
+            await bot.send_message(chat_id, random.choice(reminder_messages_local))
+    except Exception as e:
+        logger.error(f"Error sending reminder to {chat_id}: {e}")
+
+async def dispatch_reminders(now: Optional[datetime] = None) -> None:
+    """Отправка напоминаний за все минуты после последней обработанной; частоту ограничивает outbox.
+
+    Пропущенные минуты (перезапуск бота, задержка планировщика) догоняются в пределах REMINDER_CATCHUP_MINUTES.
+    """
+    now = int((now or datetime.now(timezone.utc)).timestamp()) // 60
+    async with session_scope() as session:
+        last_tick = await get_setting(session, 'reminders_last_tick')
+    first = now - config.REMINDER_CATCHUP_MINUTES
+    if last_tick is not None:
+        first = max(first, int(last_tick) + 1)
+    # Задание есть в планировщике каждого процесса, минуту обрабатывает только первый захвативший блокировку
+    minutes = [minute for minute in range(first, now + 1)
+               if await shared_state.acquire_lock(f"reminders:{minute}", ttl=(config.REMINDER_CATCHUP_MINUTES + 2) * 60)]
+    ticks = [datetime.fromtimestamp(minute * 60, timezone.utc) for minute in minutes]
+    try:
+        due = await find_due_reminders(ticks) if ticks else []
+        batch_size = config.REMINDER_BATCH_SIZE
+        for start in range(0, len(due), batch_size):
+            await asyncio.gather(*(send_reminder(chat_id, language) for chat_id, language in due[start:start + batch_size]))
+    except Exception as e:
+        # Минуты освобождаются, чтобы следующий запуск (этого или другого процесса) обработал их заново
+        logger.error(f"Error dispatching reminders, will retry {len(minutes)} minute(s): {e}")
+        for minute in minutes:
+            await shared_state.delete(f"reminders:{minute}")
+        return
+    async with session_scope() as session:
+        # Параллельный запуск с более поздней минутой мог закончиться раньше
+        last_tick = await get_setting(session, 'reminders_last_tick')
+        if last_tick is None or int(last_tick) < now:
+            await set_setting(session, 'reminders_last_tick', str(now))
+    if due:
+        logger.info(f"Sent {len(due)} reminders for {len(ticks)} minute(s) up to {ticks[-1].strftime('%H:%M')} UTC")
+
+def start_reminder_dispatcher() -> None:
+    """Одно задание раз в минуту для всех напоминаний вместо заданий на каждого пользователя.
+
+    Первый запуск сразу при старте: он досылает напоминания, пропущенные, пока бот не работал.
+    """
+    if config.SCHEDULER_JOBSTORE_URL:
+        from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+        scheduler.add_jobstore(SQLAlchemyJobStore(url=config.SCHEDULER_JOBSTORE_URL), 'persistent')
+    # Несколько экземпляров: отправка большой минуты не должна пропускать следующие.
+    # Запоздавший запуск не отбрасывается, а пропущенные минуты догоняет сам dispatch_reminders
+    scheduler.add_job(dispatch_reminders, 'cron', minute='*', timezone='UTC', id='reminder_dispatch',
+                      jobstore='persistent' if config.SCHEDULER_JOBSTORE_URL else 'default',
+                      replace_existing=True, coalesce=True, misfire_grace_time=config.REMINDER_CATCHUP_MINUTES * 60,
+                      max_instances=config.REMINDER_MAX_RUNNING_TICKS, next_run_time=datetime.now(timezone.utc))
+    scheduler.start()
 
 """ Обработка команды /start """
 
@@ -283,6 +479,7 @@ async def set_language(callback_query: types.CallbackQuery, state: FSMContext) -
         else:
             user = User(chat_id=chat_id, language=language)
             session.add(user)
+    user_context.invalidate(chat_id)
 
     # Добавляем кнопку "Support project" в разметку
     markup = InlineKeyboardMarkup(inline_keyboard=[
@@ -299,11 +496,9 @@ async def set_language(callback_query: types.CallbackQuery, state: FSMContext) -
 """ Обработка выбора уровня """
 
 @router.message(F.text.in_({"Level", "Уровень"}))
-async def handle_level_button(message: Message) -> None:
+async def handle_level_button(message: Message, user: Optional[User] = None) -> None:
     """Обработка выбора уровня языка пользователем."""
-    async with session_scope() as session:
-        user = await get_user(session, message.chat.id)
-        language = user.language if user else 'en'
+    language = user.language if user else 'en'
     markup = create_level_buttons(language)
     await bot.send_message(message.chat.id, "Choose your level:" if language == 'en' else "Выберите свой уровень:",
                            reply_markup=markup)
@@ -318,11 +513,10 @@ async def set_user_level(callback_query: types.CallbackQuery) -> None:
         user = await get_user(session, chat_id)
         if user:
             user.level = level
+    user_context.invalidate(chat_id)
     logger.info(f"User {chat_id} set their level to {level}")
 
-    async with session_scope() as session:
-        user = await get_user(session, callback_query.message.chat.id)
-        language = user.language if user else 'en'
+    language = user.language if user else 'en'
 
     message = f"Your level has been set to {level}." if language == 'en' else f"Ваш уровень установлен на {level}."
     await bot.send_message(callback_query.message.chat.id, message)
@@ -330,11 +524,9 @@ async def set_user_level(callback_query: types.CallbackQuery) -> None:
 """ Обработка информации """
 
 @router.message(F.text.in_({"Info", "Информация"}))
-async def handle_info_button(message: Message) -> None:
+async def handle_info_button(message: Message, user: Optional[User] = None) -> None:
     """Отправка информации о боте и поддержке проекта."""
-    async with session_scope() as session:
-        user = await get_user(session, message.chat.id)
-        language = user.language if user else 'en'
+    language = user.language if user else 'en'
 
     info_text = {
         'en': (
@@ -369,11 +561,9 @@ async def handle_info_button(message: Message) -> None:
     await bot.send_message(message.chat.id, info_text[language], parse_mode="html", reply_markup=markup)
 
 @router.callback_query(F.data == "support_project")
-async def handle_support_project(callback_query: types.CallbackQuery) -> None:
+async def handle_support_project(callback_query: types.CallbackQuery, user: Optional[User] = None) -> None:
     """Отправка меню с реферальными ссылками."""
-    async with session_scope() as session:
-        user = await get_user(session, callback_query.message.chat.id)
-        language = user.language if user else 'en'
+    language = user.language if user else 'en'
 
     markup = create_support_buttons(language)
     await bot.send_message(callback_query.message.chat.id,
@@ -387,11 +577,9 @@ class NotificationStates(StatesGroup):
     time = State()
 
 @router.message(F.text.in_({"Notification", "Уведомление"}))
-async def handle_notification(message: Message) -> None:
+async def handle_notification(message: Message, user: Optional[User] = None) -> None:
     """Обработка настроек уведомлений пользователя."""
-    async with session_scope() as session:
-        user = await get_user(session, message.chat.id)
-        language = user.language if user else 'en'
+    language = user.language if user else 'en'
 
     markup = create_notification_buttons(language)
     await bot.send_message(message.chat.id,
@@ -399,63 +587,43 @@ async def handle_notification(message: Message) -> None:
                            reply_markup=markup)
 
 @router.message(F.text.in_({"Enable Notifications", "Включить уведомления"}))
-async def enable_notifications(message: Message, state: FSMContext) -> None:
+async def enable_notifications(message: Message, state: FSMContext, user: Optional[User] = None) -> None:
     """Включение уведомлений и выбор дней недели."""
     await state.set_state(NotificationStates.days)
-    async with session_scope() as session:
-        user = await get_user(session, message.chat.id)
-        selected_days = user.notification_days.split(',') if user and user.notification_days else []
-        language = user.language if user else 'en'
-    markup = create_days_buttons(selected_days, language)
+    language = user.language if user else 'en'
+    markup = create_days_buttons(user.notification_mask if user else 0, language)
     await bot.send_message(message.chat.id,
                            "Select days for notifications and click Save." if language == 'en' else "Выберите дни для уведомлений и нажмите Сохранить.",
                            reply_markup=markup)
 
-@router.callback_query(F.data.startswith("toggle_"))
-async def toggle_day(callback_query: types.CallbackQuery) -> None:
+@router.callback_query(DayCallback.filter())
+async def toggle_day(callback_query: types.CallbackQuery, callback_data: DayCallback) -> None:
     """Переключение выбора дней для уведомлений."""
-    day = callback_query.data[len('toggle_'):]
+    if not 0 <= callback_data.day < len(DAYS):
+        return
+    bit = 1 << callback_data.day
     chat_id = callback_query.message.chat.id
 
     async with session_scope() as session:
-        user = await get_user(session, chat_id)
-        selected_days = user.notification_days.split(',') if user and user.notification_days else []
-        if day in selected_days:
-            selected_days.remove(day)
-        else:
-            selected_days.append(day)
-        user.notification_days = ','.join(selected_days)
-        language = user.language if user else 'en'
+        row = (await session.execute(toggle_day_statement(chat_id, bit))).first()
+    user_context.invalidate(chat_id)
+    if row is None:
+        return
 
-    markup = create_days_buttons(selected_days, language)
+    markup = create_days_buttons(row.notification_mask, row.language or 'en')
     await callback_query.message.edit_reply_markup(reply_markup=markup)
 
 @router.callback_query(F.data == "save_days")
-async def save_days(callback_query: types.CallbackQuery, state: FSMContext) -> None:
+async def save_days(callback_query: types.CallbackQuery, state: FSMContext, user: Optional[User] = None) -> None:
     """Сохранение выбранных дней для уведомлений."""
-    async with session_scope() as session:
-        user = await get_user(session, callback_query.message.chat.id)
-        selected_days = user.notification_days.split(',') if user and user.notification_days else []
-        language = user.language if user else 'en'
+    selected_days = days_from_mask(user.notification_mask) if user else []
+    language = user.language if user else 'en'
 
-    valid_days = {
-        "monday": "mon",
-        "tuesday": "tue",
-        "wednesday": "wed",
-        "thursday": "thu",
-        "friday": "fri",
-        "saturday": "sat",
-        "sunday": "sun"
-    }
-    selected_days_lower = [valid_days[day.lower()] for day in selected_days if day.lower() in valid_days]
-
-    if not selected_days_lower:
+    if not selected_days:
         await bot.send_message(callback_query.message.chat.id,
                                "No valid days selected." if language == 'en' else "Не выбраны допустимые дни.")
         return
 
-    await state.update_data(selected_days_lower=selected_days_lower)
-
     await bot.send_message(callback_query.message.chat.id,
                            f"Notifications will be sent on: {', '.join(selected_days)}." if language == 'en' else f"Уведомления будут отправляться в: {', '.join(selected_days)}.")
     await state.set_state(NotificationStates.time)
@@ -463,59 +631,51 @@ async def save_days(callback_query: types.CallbackQuery, state: FSMContext) -> N
                            "Please specify the time for notifications in HH:MM format (Moscow time)." if language == 'en' else "Пожалуйста, укажите время для уведомлений в формате ЧЧ:ММ (Московское время).")
 
 @router.message(StateFilter(NotificationStates.time))
-async def set_notification_time(message: Message, state: FSMContext) -> None:
+async def set_notification_time(message: Message, state: FSMContext, user: Optional[User] = None) -> None:
     """Установка времени уведомлений."""
     chat_id = message.chat.id
     user_input = message.text.strip()
 
     try:
         valid_time = datetime.strptime(user_input, "%H:%M")
-        valid_time_utc = valid_time - timedelta(hours=3)
-
-        data = await state.get_data()
-        selected_days_lower = data.get("selected_days_lower", [])
+        minute_utc = (valid_time.hour * 60 + valid_time.minute - config.NOTIFICATION_UTC_OFFSET * 60) % (24 * 60)
 
+        selected_days = []
         async with session_scope() as session:
-            user = await get_user(session, chat_id)
-            if user:
-                user.notification_time = valid_time_utc.strftime("%H:%M")
-                session.add(user)
+            db_user = await get_user(session, chat_id)
+            if db_user:
+                db_user.notification_minute = minute_utc
+                selected_days = days_from_mask(db_user.notification_mask)
+        user_context.invalidate(chat_id)
 
-        async with session_scope() as session:
-            user = await get_user(session, chat_id)
-            language = user.language if user else 'en'
+        language = user.language if user else 'en'
 
         await bot.send_message(
             chat_id,
-            f"Notifications will be sent on {', '.join([day.capitalize() for day in selected_days_lower])} at {valid_time.strftime('%H:%M')} (Moscow time)." if language == 'en' else f"Уведомления будут отправляться в {', '.join([day.capitalize() for day in selected_days_lower])} в {valid_time.strftime('%H:%M')} (Московское время).",
+            f"Notifications will be sent on {', '.join(selected_days)} at {valid_time.strftime('%H:%M')} (Moscow time)." if language == 'en' else f"Уведомления будут отправляться в {', '.join(selected_days)} в {valid_time.strftime('%H:%M')} (Московское время).",
             reply_markup=create_navigation_buttons(language)
         )
 
-        await schedule_notifications(chat_id, selected_days_lower, valid_time_utc.strftime("%H:%M"), language)
+        # Напоминание отправит минутное задание: оно выбирает пользователей по времени из базы данных
         await state.clear()
 
     except ValueError:
-        async with session_scope() as session:
-            user = await get_user(session, chat_id)
-            language = user.language if user else 'en'
+        language = user.language if user else 'en'
         await bot.send_message(chat_id,
                                "Please enter a valid time in HH:MM format." if language == 'en' else "Пожалуйста, введите допустимое время в формате ЧЧ:ММ.")
 
 @router.message(F.text.in_({"Disable Notifications", "Отключить уведомления"}))
-async def disable_notifications(message: Message, state: FSMContext) -> None:
+async def disable_notifications(message: Message, state: FSMContext, user: Optional[User] = None) -> None:
     """Отключение уведомлений."""
     chat_id = message.chat.id
-    job_id = f"notification_{chat_id}"
-
-    if scheduler.get_job(job_id):
-        scheduler.remove_job(job_id)
 
     async with session_scope() as session:
-        user = await get_user(session, chat_id)
-        if user:
-            user.notification_time = None
-            user.notification_days = None
-            language = user.language if user else 'en'
+        db_user = await get_user(session, chat_id)
+        if db_user:
+            db_user.notification_minute = None
+            db_user.notification_mask = 0
+    user_context.invalidate(chat_id)
+    language = user.language if user else 'en'
 
     await bot.send_message(chat_id, "Notifications disabled." if language == 'en' else "Уведомления отключены.",
                            reply_markup=create_navigation_buttons(language))
@@ -524,53 +684,17 @@ async def disable_notifications(message: Message, state: FSMContext) -> None:
 """ Обработка грамматических правил """
 
 @router.message(F.text.in_({"Grammar", "Грамматика"}))
-async def handle_grammar_button(message: Message) -> None:
+async def handle_grammar_button(message: Message, user: Optional[User] = None) -> None:
     """Обработка запроса на изучение грамматики."""
-    async with session_scope() as session:
-        user = await get_user(session, message.chat.id)
-        language = user.language if user else 'en'
+    language = user.language if user else 'en'
     await send_grammar_options(message, language)
 
-def read_grammar_rules(file_path: str) -> Dict[str, str]:
-    """Чтение правил грамматики из файла."""
-    with open(file_path, 'r', encoding='utf-8') as file:
-        lines = file.readlines()
-    rules = {}
-    current_title = None
-    current_text = []
-    section_titles = [
-        "Form", "Spelling", "Use", "Notes", "Form - regular verbs",
-        "We do not normally use in the continuous the following groups of verbs (so called state verbs):",
-        "If some of these verbs are used in the present continuous, they have a different meaning. In such a case they become action verbs.",
-        "Form - irregular verbs", "Time expressions:", "Examples:"
-    ]
-    for line in lines:
-        stripped_line = line.strip()
-        if stripped_line and stripped_line != '-----------------------------------------':
-            if stripped_line.isupper() and not stripped_line.isdigit():
-                if current_title:
-                    rules[current_title] = '\n'.join(current_text)
-                current_title = stripped_line
-                current_text = []
-            else:
-                if any(stripped_line.startswith(title) for title in section_titles):
-                    if current_text:
-                        current_text.append("")
-                    current_text.append(f"<b>{stripped_line}</b>")
-                    current_text.append("")
-                else:
-                    current_text.append(stripped_line)
-        elif stripped_line == '-----------------------------------------':
-            continue
-    if current_title:
-        rules[current_title] = '\n'.join(current_text)
-    return rules
-
-grammar_rules = read_grammar_rules(config.GRAMMAR_RULES_FILE)
-
 def create_grammar_buttons(language: str = 'en') -> InlineKeyboardMarkup:
     """Создание кнопок для выбора правил грамматики."""
-    buttons = [[InlineKeyboardButton(text=title, callback_data=title)] for title in grammar_rules.keys()]
+    bundle = content_registry.bundle
+    revision = bundle.revision('grammar_rules')
+    buttons = [[InlineKeyboardButton(text=title, callback_data=GrammarRuleCallback(rule=index, rev=revision).pack())]
+               for index, title in enumerate(bundle.grammar_rule_titles)]
     markup = InlineKeyboardMarkup(inline_keyboard=buttons)
     return markup
 
@@ -581,58 +705,41 @@ async def send_grammar_options(message: Message, language: str) -> None:
                            "Choose grammar rule:" if language == 'en' else "Выберите правило грамматики:",
                            reply_markup=markup)
 
-@router.callback_query(F.data.in_(grammar_rules.keys()))
-async def handle_grammar_selection(callback_query: types.CallbackQuery) -> None:
+@router.callback_query(GrammarRuleCallback.filter())
+async def handle_grammar_selection(callback_query: types.CallbackQuery, callback_data: GrammarRuleCallback,
+                                   user: Optional[User] = None) -> None:
     """Обработка выбора правила грамматики."""
-    rule_text = grammar_rules[callback_query.data]
+    bundle = content_registry.bundle
+    titles = bundle.grammar_rule_titles
+    # Кнопка из сообщения, отправленного до изменения списка правил
+    if callback_data.rev != bundle.revision('grammar_rules') or not 0 <= callback_data.rule < len(titles):
+        language = user.language if user else 'en'
+        await bot.send_message(callback_query.message.chat.id,
+                               "The list of rules has been updated." if language == 'en' else "Список правил обновлён.")
+        await send_grammar_options(callback_query.message, language)
+        return
+    rule_text = bundle.grammar_rules[titles[callback_data.rule]]
     await bot.send_message(callback_query.message.chat.id, rule_text, parse_mode="html")
 
 """ Обработка грамматических упражнений """
 
-def load_grammar_exercises(filepath: str) -> Dict[str, Dict[str, List[Tuple[str, str]]]]:
-    """Загрузка упражнений по грамматике из файла."""
-    grammar_exercises = {}
-    current_level = None
-    current_rule = None
-    with open(filepath, 'r', encoding='utf-8') as file:
-        for line in file:
-            line = line.strip()
-            if line.startswith('# Уровень'):
-                current_level = line.split()[-1]
-                if current_level not in grammar_exercises:
-                    grammar_exercises[current_level] = {}
-            elif line.startswith('##'):
-                current_rule = line.split(' ', 1)[1]
-                if current_level and current_rule:
-                    grammar_exercises[current_level][current_rule] = []
-            elif line:
-                if current_level and current_rule:
-                    question, answer = line.split(' - ')
-                    grammar_exercises[current_level][current_rule].append((question, answer))
-    return grammar_exercises
-
-grammar_exercises = load_grammar_exercises(config.GRAMMAR_EXERCISES_FILE)
-
 @router.message(F.text.in_({"Practice", "Практика"}))
-async def handle_practice_button(message: Message, state: FSMContext) -> None:
+async def handle_practice_button(message: Message, state: FSMContext, user: Optional[User] = None) -> None:
     """Обработка запроса на практику грамматики."""
-    async with session_scope() as session:
-        user = await get_user(session, message.chat.id)
-        language = user.language if user else 'en'
-    await send_practice_info(message.chat.id, state, language)
+    language = user.language if user else 'en'
+    level = user.level if user else 'A1'
+    await send_practice_info(message.chat.id, state, language, level)
 
-async def send_practice_info(chat_id: int, state: FSMContext, language: str) -> None:
+async def send_practice_info(chat_id: int, state: FSMContext, language: str, level: Optional[str]) -> None:
     """Отправка информации о разделе практики."""
     await bot.send_message(chat_id,
                            "Welcome to the Practice section. Here you can practice various grammar rules depending on your level. Please select a grammar rule to start practicing." if language == 'en' else "Добро пожаловать в раздел практики. Здесь вы можете практиковать различные правила грамматики в зависимости от вашего уровня. Пожалуйста, выберите правило грамматики для начала практики.")
-    async with session_scope() as session:
-        user = await get_user(session, chat_id)
-        level = user.level if user else 'A1'
-    mapped_level = LEVEL_MAPPING.get(level, 'A1-A2')
+    mapped_level = content_registry.level_mapping.get(level, 'A1-A2')
     await send_practice_options(chat_id, mapped_level, state, language)
 
 async def send_practice_exercise(chat_id: int, level: str, rule: str, state: FSMContext, language: str) -> None:
     """Отправка упражнения по грамматике пользователю."""
+    grammar_exercises = content_registry.grammar_exercises
     if level in grammar_exercises and rule in grammar_exercises[level]:
         exercises = grammar_exercises[level][rule]
         if exercises:
@@ -645,9 +752,10 @@ async def send_practice_exercise(chat_id: int, level: str, rule: str, state: FSM
                 await state.clear()
                 return
 
-            question, answer = exercises[exercise_index]
-            await state.update_data(current_exercise=(question, answer, rule), exercise_index=exercise_index + 1)
-            await bot.send_message(chat_id, question)
+            exercise = exercises[exercise_index]
+            await state.update_data(current_exercise=(exercise.question, exercise.answer, rule),
+                                    exercise_index=exercise_index + 1)
+            await bot.send_message(chat_id, exercise.question)
         else:
             await bot.send_message(chat_id,
                                    "No exercises available for this grammar rule." if language == 'en' else "Нет упражнений для этого правила грамматики.",
@@ -660,9 +768,12 @@ async def send_practice_exercise(chat_id: int, level: str, rule: str, state: FSM
 async def send_practice_options(chat_id: int, level: str, state: FSMContext, language: str) -> None:
     """Отправка пользователю вариантов упражнений для практики."""
     buttons = []
-    if level in grammar_exercises:
-        for rule in grammar_exercises[level]:
-            buttons.append([InlineKeyboardButton(text=rule, callback_data=f"practice_{rule}")])
+    bundle = content_registry.bundle
+    if level in bundle.grammar_exercises:
+        revision = bundle.revision('grammar_exercises')
+        for index, rule in enumerate(bundle.exercise_rules(level)):
+            callback_data = PracticeRuleCallback(level=level, rule=index, rev=revision).pack()
+            buttons.append([InlineKeyboardButton(text=rule, callback_data=callback_data)])
         markup = InlineKeyboardMarkup(inline_keyboard=buttons)
         await bot.send_message(chat_id,
                                "Choose a grammar rule to practice:" if language == 'en' else "Выберите правило грамматики для практики:",
@@ -672,18 +783,23 @@ async def send_practice_options(chat_id: int, level: str, state: FSMContext, lan
                                "No grammar rules found for this level." if language == 'en' else "Правила грамматики для этого уровня не найдены.",
                                reply_markup=create_navigation_buttons(language))
 
-@router.callback_query(F.data.startswith("practice_"))
-async def handle_practice_selection(callback_query: types.CallbackQuery, state: FSMContext) -> None:
+@router.callback_query(PracticeRuleCallback.filter())
+async def handle_practice_selection(callback_query: types.CallbackQuery, callback_data: PracticeRuleCallback,
+                                    state: FSMContext, user: Optional[User] = None) -> None:
     """Обработка выбора правила грамматики для практики."""
-    rule = callback_query.data[len("practice_"):]
     chat_id = callback_query.message.chat.id
+    language = user.language if user else 'en'
+    mapped_level = callback_data.level
 
-    async with session_scope() as session:
-        user = await get_user(session, chat_id)
-        language = user.language if user else 'en'
-        level = user.level if user else 'A1'
-
-    mapped_level = LEVEL_MAPPING.get(level, 'A1-A2')
+    bundle = content_registry.bundle
+    rules = bundle.exercise_rules(mapped_level)
+    # Кнопка из сообщения, отправленного до изменения упражнений
+    if callback_data.rev != bundle.revision('grammar_exercises') or not 0 <= callback_data.rule < len(rules):
+        await bot.send_message(chat_id,
+                               "The list of exercises has been updated." if language == 'en' else "Список упражнений обновлён.")
+        await send_practice_options(chat_id, mapped_level, state, language)
+        return
+    rule = rules[callback_data.rule]
 
     logger.info(f"User {chat_id} selected rule {rule} for practice.")
 
@@ -692,6 +808,14 @@ async def handle_practice_selection(callback_query: types.CallbackQuery, state:
     await send_practice_exercise(chat_id, mapped_level, rule, state, language)
     await state.set_state("practice")
 
+def find_compiled_answer(data: Dict, rule: str, correct_answer: str) -> answer_checker.CompiledAnswer:
+    """Подготовленный при загрузке ответ текущего упражнения."""
+    exercises = content_registry.grammar_exercises.get(data.get("level"), {}).get(rule, [])
+    index = data.get("exercise_index", 0) - 1
+    if 0 <= index < len(exercises) and exercises[index].answer == correct_answer:
+        return exercises[index].compiled
+    return answer_checker.compile_answer(correct_answer)
+
 @router.message(StateFilter("practice"))
 async def handle_practice_message(message: Message, state: FSMContext) -> None:
     """Обработка ответа пользователя на упражнение по грамматике."""
@@ -700,45 +824,31 @@ async def handle_practice_message(message: Message, state: FSMContext) -> None:
 
     if "current_exercise" in data:
         question, correct_answer, rule = data["current_exercise"]
-        correct_answer_normalized = contractions.fix(correct_answer.strip().lower())
-        text_normalized = contractions.fix(message.text.strip().lower())
-
-        # Удаляем местоимения из начала правильного ответа и ответа пользователя
-        correct_answer_words = correct_answer_normalized.split()
-        user_answer_words = text_normalized.split()
-
-        # Игнорируем первое слово, если оно местоимение
-        if user_answer_words and user_answer_words[0] in ["i", "you", "he", "she", "it", "we", "they"]:
-            user_answer_words = user_answer_words[1:]
-
-        if correct_answer_words and correct_answer_words[0] in ["i", "you", "he", "she", "it", "we", "they"]:
-            correct_answer_words = correct_answer_words[1:]
-
-        correct_answer_normalized = " ".join(correct_answer_words)
-        text_normalized = " ".join(user_answer_words)
-
-        # Сравнение ответа с допустимой погрешностью
-        if text_normalized == correct_answer_normalized or difflib.SequenceMatcher(None, text_normalized, correct_answer_normalized).ratio() > 0.9:
-            await bot.send_message(chat_id, "Correct!" if data.get('language', 'en') == 'en' else "Правильно!",
-                                   reply_markup=create_continue_back_buttons(data.get('language', 'en')))
+        language = data.get('language', 'en')
+        result = answer_checker.check(find_compiled_answer(data, rule, correct_answer), message.text)
+
+        if result.verdict is answer_checker.Verdict.EXACT:
+            await bot.send_message(chat_id, "Correct!" if language == 'en' else "Правильно!",
+                                   reply_markup=create_continue_back_buttons(language))
+        elif result.verdict is answer_checker.Verdict.TYPO:
+            await bot.send_message(chat_id, f"Correct, but check the spelling: {correct_answer}" if language == 'en' else f"Правильно, но проверьте написание: {correct_answer}",
+                                   reply_markup=create_continue_back_buttons(language))
         else:
-            await bot.send_message(chat_id, f"Incorrect. The correct answer is: {correct_answer}" if data.get('language', 'en') == 'en' else f"Неправильно. Правильный ответ: {correct_answer}",
-                                   reply_markup=create_continue_back_buttons(data.get('language', 'en')))
+            await bot.send_message(chat_id, f"Incorrect. The correct answer is: {correct_answer}" if language == 'en' else f"Неправильно. Правильный ответ: {correct_answer}",
+                                   reply_markup=create_continue_back_buttons(language))
 
         await state.update_data(current_exercise=None)
     else:
         await bot.send_message(chat_id, "Please select a grammar rule to start practicing." if data.get('language', 'en') == 'en' else "Пожалуйста, выберите правило грамматики для начала практики.")
 
 @router.callback_query(F.data == "continue")
-async def handle_continue(callback_query: types.CallbackQuery, state: FSMContext) -> None:
+async def handle_continue(callback_query: types.CallbackQuery, state: FSMContext, user: Optional[User] = None) -> None:
     """Обработка запроса на продолжение упражнения по грамматике."""
     data = await state.get_data()
     training_type = data.get('training_type')
     chat_id = callback_query.message.chat.id
 
-    async with session_scope() as session:
-        user = await get_user(session, chat_id)
-        language = user.language if user else 'en'
+    language = user.language if user else 'en'
 
     if training_type == "grammar":
         rule = data.get("current_rule")
@@ -762,7 +872,8 @@ async def handle_continue(callback_query: types.CallbackQuery, state: FSMContext
             await state.clear()
             return
 
-        await study_words(callback_query.message, level, state, practice=True)
+        await study_words(callback_query.message, level, state, practice=True, language=language,
+                          user_id=user.id if user else None)
 
     else:
         await bot.send_message(chat_id,
@@ -771,11 +882,9 @@ async def handle_continue(callback_query: types.CallbackQuery, state: FSMContext
         await state.clear()
 
 @router.callback_query(F.data == "go_back")
-async def handle_go_back(callback_query: types.CallbackQuery, state: FSMContext) -> None:
+async def handle_go_back(callback_query: types.CallbackQuery, state: FSMContext, user: Optional[User] = None) -> None:
     """Обработка запроса на возврат в главное меню."""
-    async with session_scope() as session:
-        user = await get_user(session, callback_query.message.chat.id)
-        language = user.language if user else 'en'
+    language = user.language if user else 'en'
 
     await bot.send_message(callback_query.message.chat.id,
                            "Returning to the main menu." if language == 'en' else "Возвращение в главное меню.",
@@ -784,54 +893,64 @@ async def handle_go_back(callback_query: types.CallbackQuery, state: FSMContext)
 
 """ Работа со словарём """
 
-def read_dictionary_file(file_path: str) -> Dict[str, Dict[str, Dict[str, str]]]:
-    """Чтение данных из файла словаря."""
-    dictionaries = {
-        'A1-A2': {},
-        'B1-B2': {},
-        'C1-C2': {}
-    }
-    current_level = None
+# Слова словаря в памяти для выборки без запросов к базе данных
+word_pool = WordPool()
+# Версия словаря в общем состоянии: процесс, добавивший слово, меняет её, остальные перезагружают пул
+DICTIONARY_VERSION_KEY = "dictionary:version"
+word_pool_version: Optional[str] = None
 
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            for line in file:
-                line = line.strip()
-                if line.startswith("Level:"):
-                    current_level = line.split(": ")[1]
-                else:
-                    parts = line.split(' - ')
-                    if len(parts) == 3:
-                        word, definition, translation = parts
-                        word = word.lower()
-                        if current_level in dictionaries:
-                            dictionaries[current_level][word] = {
-                                'definition': definition,
-                                'translation': translation
-                            }
-    except FileNotFoundError:
-        logger.error(f"Dictionary file not found at {file_path}")
-        return {}
-    except Exception as e:
-        logger.error(f"Error reading dictionary file: {e}")
-        return {}
-
-    return dictionaries
+async def load_word_pool() -> None:
+    """Загрузка всех слов словаря в пул одним запросом."""
+    async with session_scope() as session:
+        result = await session.execute(
+            select(Dictionary.id, Dictionary.level, Dictionary.word, Dictionary.translation).order_by(Dictionary.id)
+        )
+        word_pool.load(result.all())
 
-dictionaries = read_dictionary_file(config.DICTIONARY_FILE)
+async def seed_dictionary(bundle: content.ContentBundle) -> None:
+    """Загрузка словаря в базу данных, только если файл изменился с прошлой загрузки."""
+    dictionary_hash = bundle.source_hash('dictionary')
+    async with session_scope() as session:
+        if await get_setting(session, 'dictionary_hash') == dictionary_hash:
+            logger.info("Dictionary file is unchanged, skipping seeding")
+        elif await load_dictionary_into_db(bundle.dictionary, session):
+            await set_setting(session, 'dictionary_hash', dictionary_hash)
+
+async def apply_content_reload(previous: content.ContentBundle, bundle: content.ContentBundle) -> None:
+    """Обновление словаря в базе данных и пула слов после перезагрузки контента."""
+    if previous.source_hash('dictionary') != bundle.source_hash('dictionary'):
+        await seed_dictionary(bundle)
+        await load_word_pool()
+
+content_registry.on_reload(apply_content_reload)
+
+async def sync_word_pool() -> None:
+    """Перезагрузка пула слов, если словарь изменил другой процесс бота."""
+    global word_pool_version
+    if LOCAL_CACHES:
+        return
+    version = await shared_state.get(DICTIONARY_VERSION_KEY)
+    if version != word_pool_version:
+        word_pool_version = version
+        await load_word_pool()
+
+async def publish_dictionary_change() -> None:
+    """Сообщение другим процессам бота об изменении словаря."""
+    global word_pool_version
+    if LOCAL_CACHES:
+        return
+    word_pool_version = uuid.uuid4().hex
+    await shared_state.set(DICTIONARY_VERSION_KEY, word_pool_version)
 
 async def setup() -> None:
     """Настройка базы данных."""
-    async with session_scope() as session:
-        await load_dictionary_into_db(dictionaries, session)
-        await remove_duplicates_from_db(session)
+    await seed_dictionary(content_registry.bundle)
+    await load_word_pool()
 
 @router.message(F.text.in_({"Dictionary", "Словарь"}))
-async def handle_dict_button(message: Message, state: FSMContext) -> None:
+async def handle_dict_button(message: Message, state: FSMContext, user: Optional[User] = None) -> None:
     """Обработка нажатия на кнопку "Словарь"."""
-    async with session_scope() as session:
-        user = await get_user(session, message.chat.id)
-        language = user.language if user else 'en'
+    language = user.language if user else 'en'
     await show_dict_menu(message, language)
 
 async def show_dict_menu(message: Message, language: str) -> None:
@@ -841,60 +960,58 @@ async def show_dict_menu(message: Message, language: str) -> None:
                            reply_markup=markup)
 
 @router.message(StateFilter("add_word_state"))
-async def add_word(message: Message, state: FSMContext) -> None:
+async def add_word(message: Message, state: FSMContext, user: Optional[User] = None) -> None:
     """Добавление нового слова в словарь."""
     try:
         word, definition, translation = map(str.strip, message.text.split(' - '))
         word = word.lower()
+        level = content_registry.level_mapping.get(user.level if user else None, 'A1-A2')
+        added = False
         async with session_scope() as session:
-            user = await get_user(session, message.chat.id)
-            level = LEVEL_MAPPING.get(user.level, 'A1-A2')
-            existing_word = await session.execute(
-                select(Dictionary).filter_by(level=level, word=word.capitalize())
-            )
+            existing_word = await session.execute(dictionary_word_query(level, word.capitalize()))
             if not existing_word.scalars().first():
                 new_word = Dictionary(level=level, word=word.capitalize(), definition=definition,
                                       translation=translation)
                 session.add(new_word)
+                await session.flush()
+                word_pool.add(level, new_word.id, new_word.word, new_word.translation)
+                added = True
                 await bot.send_message(message.chat.id,
                                        f'The word "{word.capitalize()}" has been added to the dictionary.')
             else:
                 await bot.send_message(message.chat.id,
                                        f'The word "{word.capitalize()}" already exists in the dictionary.')
+        if added:
+            await publish_dictionary_change()
     except ValueError:
         await bot.send_message(message.chat.id, 'Invalid format. Try again.')
     await state.clear()
-    async with session_scope() as session:
-        user = await get_user(session, message.chat.id)
-        language = user.language if user else 'en'
+    language = user.language if user else 'en'
     await show_dict_menu(message, language)
 
 @router.message(StateFilter("see_meaning_state"))
-async def handle_see_meaning(message: Message, state: FSMContext) -> None:
+async def handle_see_meaning(message: Message, state: FSMContext, user: Optional[User] = None) -> None:
     """Просмотр значения слова из словаря."""
-    await show_word_definition(message)
+    await show_word_definition(message, user)
     await state.clear()
 
 @router.message(F.text.in_(
     ['Add words', 'Practice words', 'Learn words', 'See the meaning of a word', 'Go back', 'Добавить слова',
      'Практиковать слова', 'Учить слова', 'Посмотреть значение слова', 'Вернуться назад']))
-async def process_dict_action(message: Message, state: FSMContext) -> None:
+async def process_dict_action(message: Message, state: FSMContext, user: Optional[User] = None) -> None:
     """Обработка действий, связанных со словарем."""
     action = message.text.strip()
-    chat_id = message.chat.id
-    async with session_scope() as session:
-        user = await get_user(session, chat_id)
-        level = configurations['LEVEL_MAPPING'].get(user.level, 'A1-A2')
-        language = user.language if user else 'en'
+    level = content_registry.level_mapping.get(user.level if user else None, 'A1-A2')
+    language = user.language if user else 'en'
 
     if action in ['Add words', 'Добавить слова']:
         await state.set_state("add_word_state")
         await bot.send_message(message.chat.id,
                                'Enter a word, definition, and translation (for example, "word - definition - translation"):' if language == 'en' else 'Введите слово, определение и перевод (например, "слово - определение - перевод"):')
     elif action in ['Practice words', 'Практиковать слова']:
-        await study_words(message, level, state, practice=True)
+        await study_words(message, level, state, practice=True, language=language, user_id=user.id if user else None)
     elif action in ['Learn words', 'Учить слова']:
-        await study_words(message, level, state, practice=False)
+        await study_words(message, level, state, practice=False, language=language)
     elif action in ['See the meaning of a word', 'Посмотреть значение слова']:
         await state.set_state("see_meaning_state")
         await bot.send_message(message.chat.id,
@@ -905,53 +1022,73 @@ async def process_dict_action(message: Message, state: FSMContext) -> None:
                                reply_markup=create_navigation_buttons(language))
         await state.clear()
 
-async def study_words(message: Message, level: str, state: FSMContext, practice: bool) -> None:
-    """Практика слов из словаря."""
+async def pick_review_word(user_id: Optional[int], level: str) -> Optional[Tuple[int, str, str]]:
+    """Выбор слова для практики: сначала слово с наступившим сроком повторения, иначе новое слово уровня."""
+    if user_id is None:
+        return word_pool.choice(level)
     async with session_scope() as session:
-        result = await session.execute(select(Dictionary).filter(Dictionary.level == level))
-        words = result.scalars().all()
-        words_data = [(word.word, word.translation) for word in words]
-
-    if not words_data:
-        async with session_scope() as session:
-            user = await get_user(session, message.chat.id)
-            language = user.language if user else 'en'
+        result = await session.execute(due_review_query(user_id, int(time.time())))
+        due_word = result.first()
+        if due_word:
+            return tuple(due_word)
+        entry = None
+        for _ in range(3):
+            entry = word_pool.choice(level)
+            if entry is None or await session.get(WordReview, (user_id, entry[0])) is None:
+                break
+        return entry
+
+async def grade_word(user_id: int, word_id: int, correct: bool) -> None:
+    """Обновление расписания повторений слова по результату ответа."""
+    async with session_scope() as session:
+        review = await session.get(WordReview, (user_id, word_id))
+        current = srs.ReviewState(review.repetitions, review.interval_days, review.ease) if review else srs.ReviewState()
+        updated = srs.review(current, srs.QUALITY_CORRECT if correct else srs.QUALITY_WRONG)
+        await session.merge(WordReview(
+            user_id=user_id,
+            word_id=word_id,
+            repetitions=updated.repetitions,
+            interval_days=updated.interval_days,
+            ease=updated.ease,
+            due_at=srs.next_due_at(updated, int(time.time()))
+        ))
+
+async def study_words(message: Message, level: str, state: FSMContext, practice: bool, language: str = 'en',
+                      user_id: Optional[int] = None) -> None:
+    """Практика слов из словаря."""
+    await sync_word_pool()
+    if not word_pool.size(level):
         await bot.send_message(message.chat.id,
                                'The dictionary is empty or does not exist.' if language == 'en' else 'Словарь пуст или не существует.')
         await show_dict_menu(message, language)
         return
 
     if practice:
-        random_word = random.choice(words_data)
-        word, correct_translation = random_word
-        listen_button = InlineKeyboardButton(text="🔊 Listen", callback_data=f"listen_{word}")
+        word_id, word, correct_translation = await pick_review_word(user_id, level)
+        listen_button = InlineKeyboardButton(text="🔊 Listen", callback_data=ListenWordCallback(word_id=word_id).pack())
         listen_markup = InlineKeyboardMarkup(inline_keyboard=[[listen_button]])
 
         await bot.send_message(message.chat.id, f'Translate the word: {word}', reply_markup=listen_markup)
         await state.set_state("check_translation_state")
-        await state.update_data(word=word, correct_translation=correct_translation)
+        await state.update_data(word=word, word_id=word_id, correct_translation=correct_translation)
     else:
-        selected_words = random.sample(words_data, min(5, len(words_data)))
-        buttons = [[InlineKeyboardButton(text=word, callback_data=f"learn_{word}")] for word, _ in selected_words]
+        selected_words = word_pool.sample(level, 5)
+        buttons = [[InlineKeyboardButton(text=word, callback_data=LearnWordCallback(word_id=word_id).pack())]
+                   for word_id, word, _ in selected_words]
         markup = InlineKeyboardMarkup(inline_keyboard=buttons)
-        async with session_scope() as session:
-            user = await get_user(session, message.chat.id)
-            language = user.language if user else 'en'
         await bot.send_message(message.chat.id,
                                "Select a word to learn:" if language == 'en' else "Выберите слово для изучения:",
                                reply_markup=markup)
 
-@router.callback_query(F.data.startswith("learn_"))
-async def handle_learn_word(callback_query: types.CallbackQuery) -> None:
+@router.callback_query(LearnWordCallback.filter())
+async def handle_learn_word(callback_query: types.CallbackQuery, callback_data: LearnWordCallback) -> None:
     """Обработка выбора слова для изучения."""
-    word = callback_query.data[len("learn_"):]
-
     async with session_scope() as session:
-        word_entry = await session.execute(select(Dictionary).filter(Dictionary.word == word))
-        word_entry = word_entry.scalars().one_or_none()
+        word_entry = await session.get(Dictionary, callback_data.word_id)
 
         if word_entry:
-            listen_button = InlineKeyboardButton(text="🔊 Listen", callback_data=f"listen_{word_entry.word}")
+            listen_button = InlineKeyboardButton(text="🔊 Listen",
+                                                 callback_data=ListenWordCallback(word_id=word_entry.id).pack())
             listen_markup = InlineKeyboardMarkup(inline_keyboard=[[listen_button]])
             await bot.send_message(
                 callback_query.message.chat.id,
@@ -960,38 +1097,22 @@ async def handle_learn_word(callback_query: types.CallbackQuery) -> None:
                 reply_markup=listen_markup
             )
 
-@router.callback_query(F.data.startswith("listen_"))
-async def handle_listen(callback_query: types.CallbackQuery) -> None:
+@router.callback_query(ListenWordCallback.filter())
+async def handle_listen(callback_query: types.CallbackQuery, callback_data: ListenWordCallback) -> None:
     """Обработка запроса на озвучивание слова."""
-    word = callback_query.data[len("listen_"):]
-
-    speech_file_path = None
-    try:
-        speech_file_path = Path("word.mp3")
-        with client.audio.speech.with_streaming_response.create(
-                model="tts-1-hd",
-                voice="alloy",
-                input=word
-        ) as response:
-            response.stream_to_file(speech_file_path)
-
-        voice_message = FSInputFile(speech_file_path)
-        await bot.send_voice(callback_query.message.chat.id, voice_message)
-    finally:
-        if speech_file_path and speech_file_path.exists():
-            speech_file_path.unlink() 
+    async with session_scope() as session:
+        word_entry = await session.get(Dictionary, callback_data.word_id)
+    if word_entry:
+        await send_cached_voice(callback_query.message.chat.id, word_entry.word, "alloy", filename="word.mp3")
 
 @router.message(StateFilter("check_translation_state"))
-async def check_translation(message: Message, state: FSMContext) -> None:
+async def check_translation(message: Message, state: FSMContext, user: Optional[User] = None) -> None:
     """Проверка перевода слова, предложенного пользователем."""
     data = await state.get_data()
     word = data['word']
     correct_translation = data['correct_translation']
 
-    chat_id = message.chat.id
-    async with session_scope() as session:
-        user = await get_user(session, chat_id)
-        language = user.language if user else 'en'
+    language = user.language if user else 'en'
 
     if message.text.lower() in ["go back", "вернуться назад"]:
         await bot.send_message(message.chat.id,
@@ -1001,7 +1122,11 @@ async def check_translation(message: Message, state: FSMContext) -> None:
         return
 
     user_translation = message.text.strip().lower()
-    if user_translation == correct_translation.lower():
+    is_correct = user_translation == correct_translation.lower()
+    if user and data.get('word_id'):
+        await grade_word(user.id, data['word_id'], is_correct)
+
+    if is_correct:
         await bot.send_message(message.chat.id, 'Right!' if language == 'en' else 'Правильно!',
                                reply_markup=create_continue_back_buttons(language))
     else:
@@ -1009,26 +1134,17 @@ async def check_translation(message: Message, state: FSMContext) -> None:
                                f'Wrong. Correct translation: {correct_translation}' if language == 'en' else f'Неправильно. Правильный перевод: {correct_translation}',
                                reply_markup=create_continue_back_buttons(language))
 
-    async with session_scope() as session:
-        user = await get_user(session, message.chat.id)
-        level = LEVEL_MAPPING.get(user.level, 'A1-A2')
-        await state.update_data(training_type="words", level=level)
+    level = content_registry.level_mapping.get(user.level if user else None, 'A1-A2')
+    await state.update_data(training_type="words", level=level)
 
-async def show_word_definition(message: Message) -> None:
+async def show_word_definition(message: Message, user: Optional[User]) -> None:
     """Отправка определения слова из словаря."""
     word = message.text.strip().lower()
-    chat_id = message.chat.id
+    level = content_registry.level_mapping.get(user.level if user else None, 'A1-A2')
+    language = user.language if user else 'en'
 
     async with session_scope() as session:
-        user = await get_user(session, chat_id)
-        level = LEVEL_MAPPING.get(user.level, 'A1-A2')
-        language = user.language if user else 'en'
-
-        word_entry = await session.execute(
-            select(Dictionary).filter(
-                and_(Dictionary.level == level, Dictionary.word == word)
-            )
-        )
+        word_entry = await session.execute(dictionary_word_query(level, word))
         word_entry = word_entry.scalars().first()
 
     if word_entry:
@@ -1056,189 +1172,231 @@ async def start_talk(message: Message, state: FSMContext) -> None:
 
     markup = InlineKeyboardMarkup(inline_keyboard=buttons)
 
-    for character in config.CHARACTER_IMAGES:
-        photo = FSInputFile(config.CHARACTER_IMAGES[character])
-        await bot.send_photo(chat_id, photo, caption=f"{character} is ready to chat with you!")
+    await send_character_gallery(chat_id)
 
     await bot.send_message(chat_id, "Choose your character:", reply_markup=markup)
     await state.set_state("choose_character")
 
 @router.callback_query(F.data.startswith("choose_"))
-async def handle_character_choice(callback_query: types.CallbackQuery, state: FSMContext) -> None:
+async def handle_character_choice(callback_query: types.CallbackQuery, state: FSMContext,
+                                  user: Optional[User] = None) -> None:
     """Обработка выбора персонажа для диалога."""
     chosen_character = callback_query.data.split("_")[-1]
     chat_id = callback_query.message.chat.id
 
     async with session_scope() as session:
-        user = await get_user(session, chat_id)
-        if user:
-            user.chosen_character = chosen_character
-            user_level = user.level
-            language = user.language
+        db_user = await get_user(session, chat_id)
+        if db_user:
+            db_user.chosen_character = chosen_character
         else:
-            user = User(chat_id=chat_id, chosen_character=chosen_character)
-            session.add(user)
-            user_level = "A1"
-            language = 'en'
-        await session.commit()
+            session.add(User(chat_id=chat_id, chosen_character=chosen_character))
+    user_context.invalidate(chat_id)
+    user_level = user.level if user else "A1"
+    language = user.language if user else 'en'
 
-    greeting = random.choice(GREETINGS[user_level]).format(name=chosen_character)
+    greeting = random.choice(content_registry.greetings[user_level]).format(name=chosen_character)
 
     if config.CHARACTER_IMAGES.get(chosen_character):
-        photo = FSInputFile(config.CHARACTER_IMAGES[chosen_character])
-        await bot.send_photo(chat_id, photo, caption=f"{chosen_character} is ready to chat with you!")
+        await send_character_photo(chat_id, chosen_character)
 
-    await send_tts_message(chat_id, greeting, config.CHARACTER_VOICES[chosen_character])
+    await send_tts_message(chat_id, greeting, config.CHARACTER_VOICES[chosen_character], cached=True)
     await bot.send_message(chat_id, greeting, reply_markup=create_back_button(language))
 
     await state.clear()
 
 
-async def send_tts_message(chat_id: int, text: str, voice: str = "echo") -> None:
+def split_for_speech(text: str, max_chars: int) -> List[str]:
+    """Разбиение текста на части для озвучки: первое предложение отдельно, остальные группами до max_chars."""
+    sentences = [sentence for sentence in re.split(r'(?<=[.!?…])\s+', text.strip()) if sentence]
+    chunks: List[str] = []
+    for sentence in sentences:
+        # Первая часть — одно предложение, чтобы первое аудио приходило как можно раньше
+        if len(chunks) > 1 and len(chunks[-1]) + len(sentence) < max_chars:
+            chunks[-1] = f"{chunks[-1]} {sentence}"
+        else:
+            chunks.append(sentence)
+    return chunks
+
+async def send_voice_chunks(chat_id: int, chunks: List[str], voice: str) -> None:
+    """Параллельная озвучка частей текста с отправкой голосовых сообщений по порядку."""
+    semaphore = asyncio.Semaphore(config.TTS_MAX_PARALLEL)
+
+    async def synthesize(chunk: str) -> bytes:
+        async with semaphore:
+            return await gateway.synthesize_speech(chunk, voice)
+
+    tasks = [asyncio.create_task(synthesize(chunk)) for chunk in chunks]
+    try:
+        for index, task in enumerate(tasks):
+            audio = await task
+            if not audio:
+                raise Exception("TTS generated an empty file.")
+            await bot.send_voice(chat_id, BufferedInputFile(audio, filename=f"speech_{index}.mp3"))
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def send_tts_message(chat_id: int, text: str, voice: str = "echo", cached: bool = False) -> None:
     """Отправка голосового сообщения пользователю."""
-    speech_file_path = None
     try:
         text_with_pause = f"... {text}"
 
-        speech_file_path = Path("speech.mp3")
+        # Повторяющиеся фразы (например, приветствия) берутся из кэша озвучки
+        if cached:
+            await send_cached_voice(chat_id, text_with_pause, voice)
+            return
 
-        with client.audio.speech.with_streaming_response.create(
-                model="tts-1-hd",
-                voice=voice,
-                input=text_with_pause
-        ) as response:
-            response.stream_to_file(speech_file_path)
+        # Длинные ответы озвучиваются по предложениям, чтобы первое аудио приходило быстрее;
+        # ответ не длиннее TTS_CHUNK_CHARS остаётся одним голосовым сообщением
+        chunks = split_for_speech(text, config.TTS_CHUNK_CHARS) if len(text) > config.TTS_CHUNK_CHARS else [text]
+        if len(chunks) > 1:
+            chunks[0] = f"... {chunks[0]}"
+            await send_voice_chunks(chat_id, chunks, voice)
+            return
 
-        if speech_file_path.stat().st_size == 0:
+        # Аудио отправляется из памяти, без общих временных файлов
+        audio = await gateway.synthesize_speech(text_with_pause, voice)
+        if not audio:
             raise Exception("TTS generated an empty file.")
 
-        voice_message = FSInputFile(speech_file_path)
-        await bot.send_voice(chat_id, voice_message)
+        await bot.send_voice(chat_id, BufferedInputFile(audio, filename="speech.mp3"))
     except Exception as e:
         logger.error(f"Ошибка генерации TTS для текста '{text}': {e}")
         await bot.send_message(chat_id, "Извините, я не смог озвучить это сообщение. Попробуйте снова.")
-    finally:
-        if speech_file_path and speech_file_path.exists():
-            speech_file_path.unlink()
 
-async def generate_chatgpt_response(user_id: int, chosen_character: str) -> str:
+async def build_chat_messages(user_id: int, chosen_character: str, user_level: Optional[str]) -> List[Dict[str, str]]:
+    """Сборка контекста разговора для модели."""
+    async with session_scope() as session:
+        history = await get_user_history(session, user_id)
+        summary = await get_history_summary(session, user_id)
+
+    messages, context_tokens = context_builder.build_context(
+        chosen_character, user_level or "A1", history, summary, config.CONTEXT_TOKEN_BUDGET
+    )
+    logger.info(f"Context for user {user_id}: {len(messages)} messages, {context_tokens} tokens")
+    return messages
+
+async def generate_chatgpt_response(user_id: int, chosen_character: str, user_level: Optional[str]) -> str:
     """Генерация ответа с использованием модели ChatGPT."""
     try:
-        async with session_scope() as session:
-            user = await get_user(session, user_id)
-            user_level = user.level if user else "A1"
-            history = await get_user_history(session, user_id)
-
-            messages = [{"role": h.role, "content": h.content} for h in history][-config.MAX_HISTORY_LENGTH:]
-
-            system_message = {
-                "role": "system",
-                "content": (
-                    f"The user is at the {user_level} level. "
-                    f"Your name is {chosen_character}. "
-                    "You are an English learning assistant. "
-                    "You need to use only English!!! "
-                    "Act like a human, do not mention that you are a bot. "
-                    "Imagine that you have your own opinion, feelings, etc. "
-                    "Your goal is to help the user improve their English skills. "
-                    "Use the provided context to maintain a coherent conversation. "
-                    "Adjust your language complexity based on the user's level. "
-                    "Keep your responses concise, avoid unnecessary details, and do not use special symbols like *, #, etc."
-                )
-            }
-
-            messages.insert(0, system_message)
-
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=messages
-            )
-
-            return response.choices[0].message.content.strip()
+        messages = await build_chat_messages(user_id, chosen_character, user_level)
+        return await gateway.complete_chat(messages)
     except Exception as e:
         logger.error(f"OpenAI API error: {e}")
         return "Sorry, I couldn't generate a response at the moment."
 
+async def stream_chatgpt_response(chat_id: int, user_id: int, chosen_character: str, user_level: Optional[str],
+                                  reply_markup: InlineKeyboardMarkup) -> str:
+    """Потоковая генерация ответа с показом текста пользователю по мере получения."""
+    try:
+        messages = await build_chat_messages(user_id, chosen_character, user_level)
+        return await streaming.send_streamed_reply(bot, chat_id, gateway.stream_chat(messages), reply_markup)
+    except Exception as e:
+        logger.error(f"OpenAI API error: {e}")
+        response_text = "Sorry, I couldn't generate a response at the moment."
+        await bot.send_message(chat_id, response_text, reply_markup=reply_markup)
+        return response_text
+
 @router.message(F.content_type == "voice")
-async def handle_voice_message(message: Message, state: FSMContext) -> None:
+async def handle_voice_message(message: Message, state: FSMContext, user: Optional[User] = None) -> None:
     """Обработка голосового сообщения пользователя."""
     chat_id = message.chat.id
+    if user is None:
+        # История разговора хранится по пользователю, он создаётся при выборе персонажа
+        await start_talk(message, state)
+        return
+    language = user.language
 
-    audio_path = None
-    try:
-        voice_file = await bot.download(message.voice.file_id)
-        audio_path = Path("user_voice.ogg")
-        with audio_path.open("wb") as f:
-            f.write(voice_file.read())
-
-        with audio_path.open("rb") as audio_file:
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                response_format="text"
-            )
-        recognized_text = transcript.text.strip()
+    requests_in_window = await shared_state.incr(f"rate:talk:{chat_id}:{int(time.time()) // config.TALK_RATE_WINDOW}",
+                                                 ttl=config.TALK_RATE_WINDOW)
+    if requests_in_window > config.TALK_RATE_LIMIT:
+        await bot.send_message(chat_id,
+                               "You are sending messages too fast. Please wait a minute." if language == 'en' else "Вы отправляете сообщения слишком часто. Подождите минуту.")
+        return
 
-        if recognized_text:
-            logger.info(f"Whisper recognized text for chat_id {chat_id}: {recognized_text}")
-        else:
-            logger.warning(f"Whisper failed to recognize the voice message for chat_id {chat_id}")
+    # Голосовое сообщение скачивается в память и передаётся в Whisper без записи на диск
+    voice_file = await bot.download(message.voice.file_id)
+    recognized_text = await gateway.transcribe(("voice.ogg", voice_file.getvalue()))
 
-        if not recognized_text:
-            async with session_scope() as session:
-                user = await get_user(session, chat_id)
-                language = user.language if user else 'en'
-            await bot.send_message(chat_id,
-                                   "Sorry, I couldn't understand the audio. Please try again." if language == 'en' else "Извините, я не смог распознать аудио. Пожалуйста, попробуйте снова.")
-            return
+    if recognized_text:
+        logger.info(f"Whisper recognized text for chat_id {chat_id}: {recognized_text}")
+    else:
+        logger.warning(f"Whisper failed to recognize the voice message for chat_id {chat_id}")
 
-        async with session_scope() as session:
-            await add_to_history(session, chat_id, "user", recognized_text)
-            user = await get_user(session, chat_id)
-            chosen_character = user.chosen_character if user else "Lori"
+    if not recognized_text:
+        await bot.send_message(chat_id,
+                               "Sorry, I couldn't understand the audio. Please try again." if language == 'en' else "Извините, я не смог распознать аудио. Пожалуйста, попробуйте снова.")
+        return
 
-        response_text = await generate_chatgpt_response(chat_id, chosen_character)
+    async with session_scope() as session:
+        evicted = await add_to_history(session, user.id, "user", recognized_text)
+    chosen_character = user.chosen_character
+    user_level = user.level
+    async with session_scope() as session:
+        # Ходы, которые не попадут в контекст модели, сразу уходят в краткое содержание
+        evicted += await trim_history_to_budget(session, user.id, chosen_character, user_level)
 
+    if config.STREAM_RESPONSES:
+        # Текст показывается по мере генерации, озвучка начинается после получения полного ответа
+        response_text = await stream_chatgpt_response(chat_id, user.id, chosen_character, user_level,
+                                                      create_back_button(language))
+        logger.info(f"Generated response for user {chat_id}: {response_text}")
+        await send_tts_message(chat_id, response_text, config.CHARACTER_VOICES[chosen_character])
+    else:
+        response_text = await generate_chatgpt_response(user.id, chosen_character, user_level)
         logger.info(f"Generated response for user {chat_id}: {response_text}")
-
         await send_tts_message(chat_id, response_text, config.CHARACTER_VOICES[chosen_character])
-        async with session_scope() as session:
-            user = await get_user(session, chat_id)
-            language = user.language if user else 'en'
         await bot.send_message(chat_id, response_text, reply_markup=create_back_button(language))
 
-        async with session_scope() as session:
-            await add_to_history(session, chat_id, "assistant", response_text)
-    finally:
-        if audio_path and audio_path.exists():
-            audio_path.unlink()
+    async with session_scope() as session:
+        evicted += await add_to_history(session, user.id, "assistant", response_text)
+    summarize_in_background(user.id, evicted)
 
 @router.message(Command(commands=['level', 'notification', 'grammar', 'practice', 'dictionary', 'talk', 'info']))
-async def handle_command(message: Message, state: FSMContext) -> None:
+async def handle_command(message: Message, state: FSMContext, user: Optional[User] = None) -> None:
     command = message.text[1:].lower()  # Извлечение команды без "/"
     if command == "level":
-        await handle_level_button(message)
+        await handle_level_button(message, user)
     elif command == "notification":
-        await handle_notification(message)
+        await handle_notification(message, user)
     elif command == "grammar":
-        await handle_grammar_button(message)
+        await handle_grammar_button(message, user)
     elif command == "practice":
-        await handle_practice_button(message, state)
+        await handle_practice_button(message, state, user)
     elif command == "dictionary":
-        await handle_dict_button(message, state)
+        await handle_dict_button(message, state, user)
     elif command == "talk":
         await start_talk(message, state)
     elif command == "info":
-        await handle_info_button(message)
+        await handle_info_button(message, user)
 
 
 """ Запуск бота """
 
 async def main() -> None:
     await create_db()
+    await load_file_ids()
     await setup()  # Вызов функции setup, которая загружает словарь в базу данных
     dp.include_router(router)
-    await dp.start_polling(bot)
+    content_watcher = None
+    if config.CONTENT_RELOAD_INTERVAL:
+        content_watcher = asyncio.create_task(content_registry.watch(config.CONTENT_RELOAD_INTERVAL))
+    start_reminder_dispatcher()
+    try:
+        if config.WEBHOOK_URL:
+            await webhook.run_webhook(dp, bot, config.WEBHOOK_URL, config.WEBHOOK_PATH, config.WEBHOOK_HOST,
+                                      config.WEBHOOK_PORT, config.WEBHOOK_SECRET, config.WEBHOOK_CONCURRENCY,
+                                      config.WEBHOOK_QUEUE_SIZE, metrics={"outbox": outbox.metrics})
+        else:
+            await dp.start_polling(bot)
+    finally:
+        if content_watcher:
+            content_watcher.cancel()
+        scheduler.shutdown(wait=False)
+        await gateway.close()
+        await shared_state.close()
+        logger.info(f"Audio cache stats: {audio_cache.stats()}")
+        logger.info(f"Outbox stats: {outbox.metrics()}")
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,6 +1,8 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 from typing_extensions import List
 
+from callbacks import DAYS, DayCallback
+
 
 def create_back_button(language: str = 'en') -> InlineKeyboardMarkup:
     """Создание кнопки возврата в главное меню."""
@@ -63,8 +65,8 @@ def create_notification_buttons(language: str = 'en') -> ReplyKeyboardMarkup:
 
     return ReplyKeyboardMarkup(keyboard=buttons_en if language == 'en' else buttons_ru, resize_keyboard=True)
 
-def create_days_buttons(selected_days: List[str], language: str = 'en') -> InlineKeyboardMarkup:
-    """Создание кнопок для выбора дней недели для уведомлений."""
+def create_days_buttons(mask: int, language: str = 'en') -> InlineKeyboardMarkup:
+    """Создание кнопок для выбора дней недели для уведомлений по маске выбранных дней."""
     day_translations = {
         'Monday': 'Понедельник',
         'Tuesday': 'Вторник',
@@ -77,26 +79,11 @@ def create_days_buttons(selected_days: List[str], language: str = 'en') -> Inlin
 
     buttons = [
         [InlineKeyboardButton(
-            text=f"Monday {'✅' if 'Monday' in selected_days else ''}" if language == 'en' else f"{day_translations['Monday']} {'✅' if 'Monday' in selected_days else ''}",
-            callback_data="toggle_Monday")],
-        [InlineKeyboardButton(
-            text=f"Tuesday {'✅' if 'Tuesday' in selected_days else ''}" if language == 'en' else f"{day_translations['Tuesday']} {'✅' if 'Tuesday' in selected_days else ''}",
-            callback_data="toggle_Tuesday")],
-        [InlineKeyboardButton(
-            text=f"Wednesday {'✅' if 'Wednesday' in selected_days else ''}" if language == 'en' else f"{day_translations['Wednesday']} {'✅' if 'Wednesday' in selected_days else ''}",
-            callback_data="toggle_Wednesday")],
-        [InlineKeyboardButton(
-            text=f"Thursday {'✅' if 'Thursday' in selected_days else ''}" if language == 'en' else f"{day_translations['Thursday']} {'✅' if 'Thursday' in selected_days else ''}",
-            callback_data="toggle_Thursday")],
-        [InlineKeyboardButton(
-            text=f"Friday {'✅' if 'Friday' in selected_days else ''}" if language == 'en' else f"{day_translations['Friday']} {'✅' if 'Friday' in selected_days else ''}",
-            callback_data="toggle_Friday")],
-        [InlineKeyboardButton(
-            text=f"Saturday {'✅' if 'Saturday' in selected_days else ''}" if language == 'en' else f"{day_translations['Saturday']} {'✅' if 'Saturday' in selected_days else ''}",
-            callback_data="toggle_Saturday")],
-        [InlineKeyboardButton(
-            text=f"Sunday {'✅' if 'Sunday' in selected_days else ''}" if language == 'en' else f"{day_translations['Sunday']} {'✅' if 'Sunday' in selected_days else ''}",
-            callback_data="toggle_Sunday")],
+            text=f"{day if language == 'en' else day_translations[day]} {'✅' if mask & (1 << index) else ''}",
+            callback_data=DayCallback(day=index).pack())]
+        for index, day in enumerate(DAYS)
+    ]
+    buttons += [
         [InlineKeyboardButton(text="Save" if language == 'en' else "Сохранить", callback_data="save_days")]
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -0,0 +1,39 @@
+from typing import List
+
+from aiogram.filters.callback_data import CallbackData
+
+# Короткие префиксы держат callback_data далеко от лимита Telegram в 64 байта.
+# Для смены формата кнопки нужен новый префикс: старые кнопки в истории чата перестанут совпадать с фильтром.
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def days_from_mask(mask: int) -> List[str]:
+    """Дни недели из маски уведомлений: бит i — DAYS[i]."""
+    return [day for index, day in enumerate(DAYS) if mask & (1 << index)]
+
+
+class GrammarRuleCallback(CallbackData, prefix="g1"):
+    """Правило грамматики: индекс в списке правил и ревизия контента, из которой он взят."""
+    rule: int
+    rev: str
+
+
+class PracticeRuleCallback(CallbackData, prefix="p1"):
+    """Правило для практики: уровень, индекс правила уровня и ревизия упражнений."""
+    level: str
+    rule: int
+    rev: str
+
+
+class LearnWordCallback(CallbackData, prefix="lw1"):
+    word_id: int
+
+
+class ListenWordCallback(CallbackData, prefix="ls1"):
+    word_id: int
+
+
+class DayCallback(CallbackData, prefix="d1"):
+    """День недели для уведомлений: индекс в DAYS."""
+    day: int
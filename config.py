@@ -7,9 +7,57 @@ load_dotenv()
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 PROXY_API_KEY = os.getenv('PROXY_API')
 
+# OpenAI
+OPENAI_BASE_URL = "https://api.proxyapi.ru/openai/v1"
+OPENAI_MAX_CONNECTIONS = 20
+OPENAI_TIMEOUT = 60.0
+CHAT_MODEL = "gpt-4o-mini"
+TTS_MODEL = "tts-1-hd"
+STT_MODEL = "whisper-1"
+
 # База данных
 DATABASE_URL = "sqlite+aiosqlite:///bot_data.db"
 
+# Кэш пользователей (секунды)
+USER_CACHE_TTL = 30  # только при работе одним процессом (без REDIS_URL)
+
+# Общее состояние для нескольких процессов бота (FSM, file_id, счётчики, блокировки); без адреса — в памяти процесса
+REDIS_URL = os.getenv('REDIS_URL')
+SHARED_STATE_PREFIX = "englishai:"
+
+# Ограничение частоты голосовых сообщений в разговоре (запросы к OpenAI)
+TALK_RATE_LIMIT = 20
+TALK_RATE_WINDOW = 60  # секунды
+
+# Режим вебхука (без WEBHOOK_URL бот работает через polling)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # внешний адрес, например https://bot.example.com
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_HOST = "0.0.0.0"
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_CONCURRENCY = 64  # обновления скольких чатов обрабатываются одновременно
+WEBHOOK_QUEUE_SIZE = 1000  # принятых, но ещё не обработанных обновлений
+
+# Напоминания
+NOTIFICATION_UTC_OFFSET = 3  # пользователи задают время и дни по Москве (UTC+3)
+REMINDER_BATCH_SIZE = 100  # напоминаний, одновременно ожидающих в очереди отправки
+REMINDER_MAX_RUNNING_TICKS = 5
+REMINDER_CATCHUP_MINUTES = 15  # окно досылки пропущенных минут после перезапуска или задержки
+# Хранилище задания планировщика (например sqlite:///scheduler.db); без него задание в памяти процесса
+SCHEDULER_JOBSTORE_URL = os.getenv('SCHEDULER_JOBSTORE_URL')
+
+# Очередь исходящих сообщений (лимиты Telegram: около 30 сообщений в секунду на бота и 1 в секунду на чат)
+OUTBOX_GLOBAL_RATE = 25
+OUTBOX_CHAT_RATE = 1.0
+OUTBOX_CHAT_BURST = 3  # несколько сообщений в ответ на одно действие уходят без задержки
+OUTBOX_MAX_RETRIES = 3  # повторы после RetryAfter
+OUTBOX_FLOOD_CHATS = 2  # RetryAfter из стольких чатов за OUTBOX_FLOOD_WINDOW секунд останавливает всю отправку
+OUTBOX_FLOOD_WINDOW = 10
+
+# Состояния FSM в базе данных
+FSM_FLUSH_DELAY = 0.05  # задержка записи для объединения изменений (секунды)
+FSM_CACHE_SIZE = 10000
+
 # Логирование
 LOGGING_LEVEL = "INFO"
 LOGGING_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -17,6 +65,22 @@ LOGGING_FILE = 'bot.log'
 
 # История
 MAX_HISTORY_LENGTH = 5
+HISTORY_CACHE_USERS = 1000  # 0 — без кэша истории в памяти; с REDIS_URL кэш отключён
+CONTEXT_TOKEN_BUDGET = 1500
+HISTORY_SUMMARY_ENABLED = True
+SUMMARY_MAX_WORDS = 120
+
+# Потоковые ответы в разговоре
+STREAM_RESPONSES = True
+STREAM_EDIT_INTERVAL = 1.0  # минимальный интервал между редактированиями сообщения (секунды)
+
+# Кэш озвучки
+AUDIO_CACHE_DIR = "audio_cache"
+AUDIO_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# Озвучка длинных ответов по частям
+TTS_CHUNK_CHARS = 300
+TTS_MAX_PARALLEL = 3
 
 # Голоса персонажей
 CHARACTER_VOICES = {
@@ -27,13 +91,18 @@ CHARACTER_VOICES = {
     "default": "alloy"
 }
 
-# Пути к файлам
-GRAMMAR_RULES_FILE = "/root/EnglishAI/extra_files/grammar_rules.txt"
-GRAMMAR_EXERCISES_FILE = "/root/EnglishAI/extra_files/grammar_exercises.txt"
-DICTIONARY_FILE = "/root/EnglishAI/extra_files/dictionary.txt"
+# Пути к файлам (относительно каталога проекта)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GRAMMAR_RULES_FILE = os.path.join(BASE_DIR, "extra_files", "grammar_rules.txt")
+GRAMMAR_EXERCISES_FILE = os.path.join(BASE_DIR, "extra_files", "grammar_exercises.txt")
+DICTIONARY_FILE = os.path.join(BASE_DIR, "extra_files", "dictionary.txt")
+CONFIGURATIONS_FILE = os.path.join(BASE_DIR, "configurations.json")
+# Предкомпилированный контент (собирается из файлов выше: python content.py)
+CONTENT_BUNDLE_FILE = os.path.join(BASE_DIR, "content.bundle")
+CONTENT_RELOAD_INTERVAL = 5  # период проверки изменений исходных файлов (секунды), 0 — без перезагрузки
 CHARACTER_IMAGES = {
-    "Lori": "/root/EnglishAI/images/Lori_image.jpg",
-    "Kiko": "/root/EnglishAI/images/Kiko_image.jpg",
-    "Nancy": "/root/EnglishAI/images/Nancy_image.jpg",
-    "Broot": "/root/EnglishAI/images/Broot_image.jpg"
+    "Lori": os.path.join(BASE_DIR, "images", "Lori_image.jpg"),
+    "Kiko": os.path.join(BASE_DIR, "images", "Kiko_image.jpg"),
+    "Nancy": os.path.join(BASE_DIR, "images", "Nancy_image.jpg"),
+    "Broot": os.path.join(BASE_DIR, "images", "Broot_image.jpg")
 }
@@ -0,0 +1,409 @@
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import mmap
+import os
+import pickle
+import struct
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Union
+
+import answer_checker
+import config
+
+logger = logging.getLogger(__name__)
+
+# Версия формата пакета: увеличивать при изменении парсеров или структуры разделов,
+# в том числе при изменении нормализации ответов в answer_checker
+SCHEMA_VERSION = 2
+MAGIC = b"EAIC"
+# Заголовок файла: сигнатура, версия формата, длина метаданных
+_PREFIX = struct.Struct("<4sII")
+
+# Разделы пакета и исходные файлы, из которых они собираются
+SOURCES = {
+    "configurations": config.CONFIGURATIONS_FILE,
+    "grammar_rules": config.GRAMMAR_RULES_FILE,
+    "grammar_exercises": config.GRAMMAR_EXERCISES_FILE,
+    "dictionary": config.DICTIONARY_FILE
+}
+
+
+class Exercise(NamedTuple):
+    question: str
+    answer: str
+    compiled: answer_checker.CompiledAnswer
+
+
+def load_configurations(file_path: str) -> Dict[str, Any]:
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def read_grammar_rules(file_path: str) -> Dict[str, str]:
+    """Чтение правил грамматики из файла."""
+    with open(file_path, 'r', encoding='utf-8') as file:
+        lines = file.readlines()
+    rules = {}
+    current_title = None
+    current_text = []
+    section_titles = [
+        "Form", "Spelling", "Use", "Notes", "Form - regular verbs",
+        "We do not normally use in the continuous the following groups of verbs (so called state verbs):",
+        "If some of these verbs are used in the present continuous, they have a different meaning. In such a case they become action verbs.",
+        "Form - irregular verbs", "Time expressions:", "Examples:"
+    ]
+    for line in lines:
+        stripped_line = line.strip()
+        if stripped_line and stripped_line != '-----------------------------------------':
+            if stripped_line.isupper() and not stripped_line.isdigit():
+                if current_title:
+                    rules[current_title] = '\n'.join(current_text)
+                current_title = stripped_line
+                current_text = []
+            else:
+                if any(stripped_line.startswith(title) for title in section_titles):
+                    if current_text:
+                        current_text.append("")
+                    current_text.append(f"<b>{stripped_line}</b>")
+                    current_text.append("")
+                else:
+                    current_text.append(stripped_line)
+        elif stripped_line == '-----------------------------------------':
+            continue
+    if current_title:
+        rules[current_title] = '\n'.join(current_text)
+    return rules
+
+
+def load_grammar_exercises(filepath: str) -> Dict[str, Dict[str, List[Exercise]]]:
+    """Загрузка упражнений по грамматике из файла."""
+    grammar_exercises = {}
+    current_level = None
+    current_rule = None
+    pairs = []
+    with open(filepath, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if line.startswith('# Уровень'):
+                current_level = line.split()[-1]
+                if current_level not in grammar_exercises:
+                    grammar_exercises[current_level] = {}
+            elif line.startswith('##'):
+                current_rule = line.split(' ', 1)[1]
+                if current_level and current_rule:
+                    grammar_exercises[current_level][current_rule] = []
+            elif line:
+                if current_level and current_rule:
+                    question, answer = line.split(' - ')
+                    pairs.append((grammar_exercises[current_level][current_rule], question, answer))
+    # Все слова упражнений — настоящие слова, опечаткой другого слова они не считаются
+    known_words = answer_checker.build_known_words(text for _, question, answer in pairs for text in (question, answer))
+    for exercises, question, answer in pairs:
+        exercises.append(Exercise(question, answer, answer_checker.compile_answer(answer, known_words)))
+    return grammar_exercises
+
+
+def read_dictionary_file(file_path: str) -> Dict[str, Dict[str, Dict[str, str]]]:
+    """Чтение данных из файла словаря."""
+    dictionaries = {
+        'A1-A2': {},
+        'B1-B2': {},
+        'C1-C2': {}
+    }
+    current_level = None
+
+    try:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            for line in file:
+                line = line.strip()
+                if line.startswith("Level:"):
+                    current_level = line.split(": ")[1]
+                else:
+                    parts = line.split(' - ')
+                    if len(parts) == 3:
+                        word, definition, translation = parts
+                        word = word.lower()
+                        if current_level in dictionaries:
+                            dictionaries[current_level][word] = {
+                                'definition': definition,
+                                'translation': translation
+                            }
+    except FileNotFoundError:
+        logger.error(f"Dictionary file not found at {file_path}")
+        return {}
+    except Exception as e:
+        logger.error(f"Error reading dictionary file: {e}")
+        return {}
+
+    return dictionaries
+
+
+PARSERS = {
+    "configurations": load_configurations,
+    "grammar_rules": read_grammar_rules,
+    "grammar_exercises": load_grammar_exercises,
+    "dictionary": read_dictionary_file
+}
+
+
+def file_signature(path: str) -> Optional[List[int]]:
+    """Быстрая проверка изменения файла без чтения содержимого: размер и время изменения."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def file_hash(path: str) -> Optional[str]:
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+class ContentBundle:
+    """Предкомпилированный контент бота; разделы распаковываются из отображённого в память файла при первом обращении."""
+
+    def __init__(self, header: Dict[str, Any], buffer: Union[mmap.mmap, bytes], data_start: int) -> None:
+        self.sources: Dict[str, Dict[str, Any]] = header["sources"]
+        self._offsets: Dict[str, List[int]] = header["sections"]
+        self._buffer = buffer
+        self._data_start = data_start
+        self._sections: Dict[str, Any] = {}
+        # Разделы, которые не удалось распаковать: пакет считается устаревшим и пересобирается
+        self.broken: Set[str] = set()
+        self._exercise_rules: Dict[str, List[str]] = {}
+
+    def raw(self, name: str) -> bytes:
+        start, end = self._offsets[name]
+        return self._buffer[self._data_start + start:self._data_start + end]
+
+    def section(self, name: str) -> Any:
+        if name not in self._sections:
+            try:
+                self._sections[name] = pickle.loads(self.raw(name))
+            except Exception as e:
+                # Например, классы раздела сохранены под другим модулем: раздел разбирается из исходного файла
+                logger.warning(f"Content bundle section {name} is unreadable, compiling it from the source: {e}")
+                self.broken.add(name)
+                self._sections[name] = PARSERS[name](self.sources[name]["path"])
+        return self._sections[name]
+
+    def is_readable(self, name: str) -> bool:
+        self.section(name)
+        return name not in self.broken
+
+    def source_hash(self, name: str) -> Optional[str]:
+        return self.sources[name]["sha256"]
+
+    def revision(self, name: str) -> str:
+        """Короткая ревизия раздела для ссылок на его элементы по индексу (например, в callback_data)."""
+        return (self.source_hash(name) or "")[:8]
+
+    @functools.cached_property
+    def grammar_rule_titles(self) -> List[str]:
+        """Названия правил по порядку: позиция в списке служит коротким идентификатором правила."""
+        return list(self.grammar_rules)
+
+    def exercise_rules(self, level: str) -> List[str]:
+        """Правила с упражнениями уровня по порядку."""
+        if level not in self._exercise_rules:
+            self._exercise_rules[level] = list(self.grammar_exercises.get(level, {}))
+        return self._exercise_rules[level]
+
+    def is_fresh(self, sources: Dict[str, str]) -> bool:
+        """Пакет собран из тех же файлов и они не менялись с момента сборки."""
+        if set(sources) != set(self.sources) or self.broken:
+            return False
+        return all(
+            self.sources[name]["path"] == path and self.sources[name]["signature"] == file_signature(path)
+            for name, path in sources.items()
+        )
+
+    @property
+    def configurations(self) -> Dict[str, Any]:
+        return self.section("configurations")
+
+    @property
+    def grammar_rules(self) -> Dict[str, str]:
+        return self.section("grammar_rules")
+
+    @property
+    def grammar_exercises(self) -> Dict[str, Dict[str, List[Exercise]]]:
+        return self.section("grammar_exercises")
+
+    @property
+    def dictionary(self) -> Dict[str, Dict[str, Dict[str, str]]]:
+        return self.section("dictionary")
+
+
+def pack(sources: Dict[str, Dict[str, Any]], sections: Dict[str, bytes]) -> bytes:
+    """Сборка файла пакета: префикс, метаданные, затем разделы подряд (смещения — от начала разделов)."""
+    offsets: Dict[str, List[int]] = {}
+    position = 0
+    for name, data in sections.items():
+        offsets[name] = [position, position + len(data)]
+        position += len(data)
+    header = pickle.dumps({"sources": sources, "sections": offsets}, protocol=pickle.HIGHEST_PROTOCOL)
+    return b"".join([_PREFIX.pack(MAGIC, SCHEMA_VERSION, len(header)), header, *sections.values()])
+
+
+def unpack(buffer: Union[mmap.mmap, bytes]) -> ContentBundle:
+    magic, version, header_length = _PREFIX.unpack_from(buffer)
+    if magic != MAGIC or version != SCHEMA_VERSION:
+        raise ValueError(f"unsupported bundle format {magic!r} v{version}")
+    data_start = _PREFIX.size + header_length
+    return ContentBundle(pickle.loads(buffer[_PREFIX.size:data_start]), buffer, data_start)
+
+
+def open_bundle(path: str) -> Optional[ContentBundle]:
+    """Открытие пакета; None, если файла нет, он повреждён или собран другой версией формата."""
+    try:
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        return unpack(buffer)
+    except Exception as e:
+        logger.warning(f"Content bundle {path} is unreadable, rebuilding: {e}")
+        return None
+
+
+def build_bundle(path: str, sources: Dict[str, str], previous: Optional[ContentBundle] = None) -> ContentBundle:
+    """Сборка пакета; разделы с неизменившимися исходниками переносятся из предыдущего пакета без разбора."""
+    metadata: Dict[str, Dict[str, Any]] = {}
+    sections: Dict[str, bytes] = {}
+    for name, source_path in sources.items():
+        signature = file_signature(source_path)
+        sha256 = file_hash(source_path)
+        metadata[name] = {"path": source_path, "signature": signature, "sha256": sha256}
+        if (previous is not None and name in previous.sources and previous.source_hash(name) == sha256
+                and previous.is_readable(name)):
+            sections[name] = previous.raw(name)
+        else:
+            logger.info(f"Compiling {name} from {source_path}")
+            sections[name] = pickle.dumps(PARSERS[name](source_path), protocol=pickle.HIGHEST_PROTOCOL)
+
+    data = pack(metadata, sections)
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write content bundle {path}, using it from memory: {e}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        return unpack(data)
+    return open_bundle(path)
+
+
+def load_bundle(path: str = config.CONTENT_BUNDLE_FILE, sources: Optional[Dict[str, str]] = None) -> ContentBundle:
+    """Загрузка пакета контента с пересборкой, если исходные файлы изменились."""
+    sources = sources or SOURCES
+    bundle = open_bundle(path)
+    if bundle is not None and bundle.is_fresh(sources):
+        return bundle
+    return build_bundle(path, sources, previous=bundle)
+
+
+
+class ContentRegistry:
+    """Текущий контент бота с заменой на лету при изменении исходных файлов.
+
+    Новый пакет собирается в отдельном потоке и подменяется одним присваиванием,
+    поэтому обработчики всегда видят согласованный набор данных.
+    """
+
+    def __init__(self, path: str = config.CONTENT_BUNDLE_FILE, sources: Optional[Dict[str, str]] = None) -> None:
+        self.path = path
+        self.sources = sources or SOURCES
+        self.bundle = load_bundle(path, self.sources)
+        self._listeners: List[Callable[[ContentBundle, ContentBundle], Awaitable[None]]] = []
+        # Состояние файлов, из которых не удалось собрать пакет: повторная попытка — только после новых изменений
+        self._failed_signatures: Optional[Dict[str, Optional[List[int]]]] = None
+
+    def on_reload(self, listener: Callable[[ContentBundle, ContentBundle], Awaitable[None]]) -> None:
+        """Регистрация обработчика, вызываемого со старым и новым пакетом после замены."""
+        self._listeners.append(listener)
+
+    @property
+    def configurations(self) -> Dict[str, Any]:
+        return self.bundle.configurations
+
+    @property
+    def level_mapping(self) -> Dict[str, str]:
+        return self.bundle.configurations['LEVEL_MAPPING']
+
+    @property
+    def greetings(self) -> Dict[str, List[str]]:
+        return self.bundle.configurations['GREETINGS']
+
+    @property
+    def reminder_messages(self) -> Dict[str, List[str]]:
+        return self.bundle.configurations['REMINDER_MESSAGES']
+
+    @property
+    def grammar_rules(self) -> Dict[str, str]:
+        return self.bundle.grammar_rules
+
+    @property
+    def grammar_exercises(self) -> Dict[str, Dict[str, List[Exercise]]]:
+        return self.bundle.grammar_exercises
+
+    @property
+    def dictionary(self) -> Dict[str, Dict[str, Dict[str, str]]]:
+        return self.bundle.dictionary
+
+    async def reload_if_changed(self) -> bool:
+        """Пересборка и замена пакета, если исходные файлы изменились."""
+        if self.bundle.is_fresh(self.sources):
+            return False
+        signatures = {name: file_signature(path) for name, path in self.sources.items()}
+        if signatures == self._failed_signatures:
+            return False
+        previous = self.bundle
+        try:
+            bundle = await asyncio.to_thread(build_bundle, self.path, self.sources, previous)
+        except Exception:
+            self._failed_signatures = signatures
+            raise
+        self._failed_signatures = None
+        # Разделы, нужные обработчикам сразу, распаковываются до замены, вне цикла событий
+        await asyncio.to_thread(lambda: (bundle.configurations, bundle.grammar_rules, bundle.grammar_exercises))
+        self.bundle = bundle
+        logger.info("Content reloaded")
+        for listener in self._listeners:
+            try:
+                await listener(previous, bundle)
+            except Exception as e:
+                logger.error(f"Error applying content reload: {e}")
+        return True
+
+    async def watch(self, interval: float) -> None:
+        """Периодическая проверка исходных файлов по времени изменения."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reload_if_changed()
+            except Exception as e:
+                # Ошибка в исходном файле не должна ломать бота: остаётся предыдущий контент
+                logger.error(f"Error reloading content, keeping the previous version: {e}")
+
+
+if __name__ == "__main__":
+    # Сборка через импортированный модуль: иначе Exercise сохраняется в пакете как __main__.Exercise,
+    # и бот не может распаковать упражнения. Все разделы собираются заново: в этом процессе
+    # __main__.Exercise распаковывается, и такие разделы старого пакета нельзя отличить от исправных
+    import content
+
+    logging.basicConfig(level=config.LOGGING_LEVEL, format=config.LOGGING_FORMAT)
+    content.build_bundle(config.CONTENT_BUNDLE_FILE, content.SOURCES)
@@ -0,0 +1,118 @@
+import functools
+import logging
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Служебные токены, которые модель добавляет к каждому сообщению
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SYSTEM_PROMPT = (
+    "You are an English learning assistant. "
+    "You need to use only English!!! "
+    "Act like a human, do not mention that you are a bot. "
+    "Imagine that you have your own opinion, feelings, etc. "
+    "Your goal is to help the user improve their English skills. "
+    "Use the provided context to maintain a coherent conversation. "
+    "Adjust your language complexity based on the user's level. "
+    "Keep your responses concise, avoid unnecessary details, and do not use special symbols like *, #, etc. "
+    "Your name is {character}. "
+    "The user is at the {level} level."
+)
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    """Локальный токенизатор; None, если tiktoken недоступен."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"Tokenizer is unavailable, falling back to estimation: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Подсчёт токенов в тексте (без токенизатора — оценка по длине)."""
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(message: Dict[str, str]) -> int:
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+@functools.lru_cache(maxsize=None)
+def system_prompt(character: str, level: str) -> str:
+    """Системный промпт, одинаковый до байта для пары (персонаж, уровень)."""
+    return SYSTEM_PROMPT.format(character=character, level=level)
+
+
+def split_turns(history: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+    """Разбиение истории на ходы: сообщение пользователя и ответы на него."""
+    turns: List[List[Dict[str, str]]] = []
+    for message in history:
+        if message["role"] == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def context_header(character: str, level: str, summary: Optional[str]) -> List[Dict[str, str]]:
+    """Системные сообщения перед историей: промпт и краткое содержание."""
+    messages = [{"role": "system", "content": system_prompt(character, level)}]
+    if summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+    return messages
+
+
+def fit_history(history: List[Dict[str, str]], used_tokens: int, token_budget: int) -> Tuple[int, int]:
+    """Индекс первого сообщения истории, с которого целые ходы помещаются в бюджет, и итоговое число токенов."""
+    start = len(history)
+    for turn in reversed(split_turns(history)):
+        turn_tokens = sum(count_message_tokens(message) for message in turn)
+        # Последний ход отправляется всегда, даже если он не помещается в бюджет
+        if start < len(history) and used_tokens + turn_tokens > token_budget:
+            break
+        start -= len(turn)
+        used_tokens += turn_tokens
+    return start, used_tokens
+
+
+def build_context(character: str, level: str, history: List[Dict[str, str]], summary: Optional[str],
+                  token_budget: int) -> Tuple[List[Dict[str, str]], int]:
+    """Сборка сообщений для модели: промпт, краткое содержание и целые ходы в пределах бюджета токенов."""
+    messages = context_header(character, level, summary)
+    used_tokens = sum(count_message_tokens(message) for message in messages)
+    start, used_tokens = fit_history(history, used_tokens, token_budget)
+    return messages + history[start:], used_tokens
+
+
+def overflow(character: str, level: str, history: List[Dict[str, str]], summary: Optional[str],
+             token_budget: int) -> int:
+    """Число первых сообщений истории, которые build_context не отправит модели."""
+    used_tokens = sum(count_message_tokens(message) for message in context_header(character, level, summary))
+    return fit_history(history, used_tokens, token_budget)[0]
+
+
+def summary_request(summary: Optional[str], messages: List[Dict[str, str]], max_words: int) -> List[Dict[str, str]]:
+    """Запрос на обновление краткого содержания разговора вытесненными сообщениями."""
+    transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You maintain a running summary of a conversation between an English learner and a tutor. "
+                f"Merge the new messages into the summary. Keep names, facts and topics. Use at most {max_words} words."
+            )
+        },
+        {"role": "user", "content": f"Current summary:\n{summary or '(empty)'}\n\nNew messages:\n{transcript}"}
+    ]
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Set
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import Column, MetaData, String, Table, Text, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+
+class Record(NamedTuple):
+    state: Optional[str] = None
+    data: Dict[str, Any] = {}
+    # Сериализованные данные: считаются при записи, чтобы несериализуемые значения падали сразу в обработчике
+    blob: Optional[str] = None
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM в базе данных бота: одна строка с состоянием и JSON-данными на ключ.
+
+    Изменения копятся в памяти и записываются одним пакетом через flush_delay секунд,
+    поэтому несколько update_data подряд в одном обработчике дают одну запись.
+    Прочитанные записи кэшируются: база данных принадлежит одному процессу бота.
+    """
+
+    def __init__(self, engine: AsyncEngine, metadata: MetaData, flush_delay: float = 0.05,
+                 cache_size: int = 10000) -> None:
+        self.engine = engine
+        self.flush_delay = flush_delay
+        self.cache_size = cache_size
+        self.table = Table(
+            "fsm_states", metadata,
+            Column("key", String, primary_key=True),
+            Column("state", String, nullable=True),
+            Column("data", Text, nullable=True)
+        )
+        self._records: "OrderedDict[str, Record]" = OrderedDict()
+        self._dirty: Set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def build_key(key: StorageKey) -> str:
+        return ":".join(str(part) for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id or "", key.business_connection_id or "", key.destiny
+        ))
+
+    async def _load(self, key: str) -> Record:
+        record = self._records.get(key)
+        if record is not None:
+            self._records.move_to_end(key)
+            return record
+        async with self.engine.connect() as connection:
+            row = (await connection.execute(
+                select(self.table.c.state, self.table.c.data).where(self.table.c.key == key)
+            )).first()
+        # Пока шёл запрос, запись могла быть загружена или изменена другим обработчиком
+        if key in self._records:
+            return self._records[key]
+        record = Record(row.state, json.loads(row.data) if row.data else {}, row.data) if row else Record()
+        self._remember(key, record)
+        return record
+
+    def _remember(self, key: str, record: Record) -> None:
+        self._records[key] = record
+        self._records.move_to_end(key)
+        # Из кэша вытесняются только записи, уже сохранённые в базе данных
+        while len(self._records) > self.cache_size:
+            oldest = next((cached for cached in self._records if cached not in self._dirty), None)
+            if oldest is None:
+                break
+            del self._records[oldest]
+
+    def _update(self, key: str, record: Record) -> None:
+        self._dirty.add(key)
+        self._remember(key, record)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_delay)
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Запись накопленных изменений одной транзакцией."""
+        if not self._dirty:
+            return
+        keys, self._dirty = self._dirty, set()
+        records = {key: self._records[key] for key in keys}
+        upserts = []
+        deletes = []
+        for key, record in records.items():
+            if record.state is None and not record.data:
+                deletes.append(key)
+            else:
+                upserts.append({"key": key, "state": record.state, "data": record.blob})
+        try:
+            async with self.engine.begin() as connection:
+                if upserts:
+                    statement = sqlite_insert(self.table)
+                    await connection.execute(
+                        statement.on_conflict_do_update(
+                            index_elements=[self.table.c.key],
+                            set_={"state": statement.excluded.state, "data": statement.excluded.data}
+                        ),
+                        upserts
+                    )
+                if deletes:
+                    await connection.execute(self.table.delete().where(self.table.c.key.in_(deletes)))
+        except asyncio.CancelledError:
+            # Отменённая запись не должна терять изменения: их сохранит следующий flush
+            self._requeue(records)
+            raise
+        except Exception as e:
+            logger.error(f"Error saving FSM state, will retry: {e}")
+            self._requeue(records)
+            if self._flush_task is None or self._flush_task.done() or self._flush_task is asyncio.current_task():
+                self._flush_task = asyncio.create_task(self._flush_later())
+
+    def _requeue(self, records: Dict[str, Record]) -> None:
+        # Записи, изменённые во время неудачной записи, уже новее сохраняемых
+        self._dirty |= set(records)
+        for key, record in records.items():
+            self._records.setdefault(key, record)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.build_key(key)
+        record = await self._load(storage_key)
+        self._update(storage_key, record._replace(state=state.state if isinstance(state, State) else state))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(self.build_key(key))).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self.build_key(key)
+        record = await self._load(storage_key)
+        blob = json.dumps(data, ensure_ascii=False, separators=(",", ":")) if data else None
+        self._update(storage_key, record._replace(data=data.copy(), blob=blob))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._load(self.build_key(key))).data.copy()
+
+    async def close(self) -> None:
+        # Отложенная запись дожидается завершения: отмена посреди flush прервала бы транзакцию
+        if self._flush_task is not None and not self._flush_task.done():
+            await asyncio.shield(self._flush_task)
+        await self.flush()
@@ -0,0 +1,64 @@
+import logging
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+import openai
+
+import config
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[openai.AsyncOpenAI] = None
+
+
+def get_client() -> openai.AsyncOpenAI:
+    """Общий асинхронный клиент OpenAI с пулом HTTP-соединений."""
+    global _client
+    if _client is None:
+        http_client = openai.DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=config.OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=config.OPENAI_MAX_CONNECTIONS
+            ),
+            timeout=config.OPENAI_TIMEOUT
+        )
+        _client = openai.AsyncOpenAI(
+            api_key=config.PROXY_API_KEY,
+            base_url=config.OPENAI_BASE_URL,
+            http_client=http_client
+        )
+    return _client
+
+
+async def close() -> None:
+    """Закрытие общего клиента и его соединений."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+async def complete_chat(messages: List[Dict[str, str]], model: str = config.CHAT_MODEL) -> str:
+    """Получение ответа чат-модели."""
+    response = await get_client().chat.completions.create(model=model, messages=messages)
+    return response.choices[0].message.content.strip()
+
+
+async def stream_chat(messages: List[Dict[str, str]], model: str = config.CHAT_MODEL) -> AsyncIterator[str]:
+    """Получение ответа чат-модели по частям по мере генерации."""
+    stream = await get_client().chat.completions.create(model=model, messages=messages, stream=True)
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+async def synthesize_speech(text: str, voice: str, model: str = config.TTS_MODEL) -> bytes:
+    """Синтез речи, возвращает аудио в виде байтов."""
+    response = await get_client().audio.speech.create(model=model, voice=voice, input=text)
+    return response.content
+
+
+async def transcribe(audio_file, model: str = config.STT_MODEL) -> str:
+    """Распознавание речи из аудиофайла."""
+    transcript = await get_client().audio.transcriptions.create(model=model, file=audio_file)
+    return transcript.text.strip()
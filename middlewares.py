@@ -0,0 +1,86 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+
+class CurrentUserMiddleware(BaseMiddleware):
+    """Загрузка пользователя один раз на обновление с кратковременным кэшем по chat_id."""
+
+    def __init__(self, loader: Callable[[int], Awaitable[Any]], ttl: float, max_size: int = 10000) -> None:
+        self.loader = loader
+        self.ttl = ttl
+        self.max_size = max_size
+        self._cache: Dict[int, Tuple[float, Any]] = {}
+
+    async def get(self, chat_id: int) -> Optional[Any]:
+        """Получение пользователя из кэша или из базы данных."""
+        now = time.monotonic()
+        cached = self._cache.get(chat_id)
+        if cached and cached[0] > now:
+            return cached[1]
+        user = await self.loader(chat_id)
+        if len(self._cache) >= self.max_size:
+            self._purge(now)
+        self._cache[chat_id] = (now + self.ttl, user)
+        return user
+
+    def invalidate(self, chat_id: int) -> None:
+        """Сброс кэша после изменения данных пользователя."""
+        self._cache.pop(chat_id, None)
+
+    def _purge(self, now: float) -> None:
+        expired = [chat_id for chat_id, (expires_at, _) in self._cache.items() if expires_at <= now]
+        for chat_id in expired:
+            del self._cache[chat_id]
+        if len(self._cache) >= self.max_size:
+            self._cache.clear()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        chat = data.get("event_chat")
+        data["user"] = await self.get(chat.id) if chat else None
+        return await handler(event, data)
+
+
+class ChatLockMiddleware(BaseMiddleware):
+    """Последовательная обработка обновлений одного чата и параллельная — разных чатов.
+
+    Блокировка чата существует, пока есть обновления, которые её удерживают или ждут.
+    """
+
+    def __init__(self) -> None:
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._holders: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        chat = data.get("event_chat")
+        if chat is None:
+            return await handler(event, data)
+        chat_id = chat.id
+        lock = self._locks.get(chat_id)
+        if lock is None:
+            lock = self._locks[chat_id] = asyncio.Lock()
+        self._holders[chat_id] = self._holders.get(chat_id, 0) + 1
+        try:
+            async with lock:
+                return await handler(event, data)
+        finally:
+            self._holders[chat_id] -= 1
+            if not self._holders[chat_id]:
+                del self._holders[chat_id]
+                del self._locks[chat_id]
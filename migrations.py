@@ -0,0 +1,105 @@
+import logging
+from typing import Callable, List
+
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from callbacks import DAYS
+
+logger = logging.getLogger(__name__)
+
+# Версия схемы хранится в PRAGMA user_version: N — применены первые N миграций списка.
+# Изменение схемы — новая функция в конце списка; уже выпущенные миграции не меняются.
+MIGRATIONS: List[Callable[[Connection, MetaData], None]] = []
+
+
+def migration(step: Callable[[Connection, MetaData], None]) -> Callable[[Connection, MetaData], None]:
+    MIGRATIONS.append(step)
+    return step
+
+
+# Индексы, которые до появления версий добавлялись в существующие таблицы при запуске
+BASELINE_INDEXES = [
+    'uq_dictionaries_level_word',
+    'ix_user_histories_user_id_id',
+    'ix_word_reviews_user_id_due_at',
+    'ix_users_notification_minute_mask'
+]
+
+
+def migrate_notification_schedule(connection: Connection) -> None:
+    """Перенос расписания уведомлений из строк (время HH:MM и названия дней) в целочисленные столбцы."""
+    columns = {column['name'] for column in inspect(connection).get_columns('users')}
+    if 'notification_days' not in columns:
+        return
+    if 'notification_mask' not in columns:
+        connection.execute(text("ALTER TABLE users ADD COLUMN notification_minute INTEGER"))
+        connection.execute(text("ALTER TABLE users ADD COLUMN notification_mask INTEGER NOT NULL DEFAULT 0"))
+    rows = connection.execute(text(
+        "SELECT id, notification_time, notification_days FROM users "
+        "WHERE notification_time IS NOT NULL OR notification_days IS NOT NULL"
+    ))
+    schedules = []
+    for user_id, notification_time, notification_days in rows:
+        minute = None
+        if notification_time:
+            hours, minutes = map(int, notification_time.split(':'))
+            minute = hours * 60 + minutes
+        mask = 0
+        for day in (notification_days or '').split(','):
+            if day in DAYS:
+                mask |= 1 << DAYS.index(day)
+        schedules.append({"id": user_id, "minute": minute, "mask": mask})
+    if schedules:
+        connection.execute(
+            text("UPDATE users SET notification_minute = :minute, notification_mask = :mask WHERE id = :id"), schedules
+        )
+    connection.execute(text("DROP INDEX IF EXISTS ix_users_notification_time"))
+    connection.execute(text("ALTER TABLE users DROP COLUMN notification_time"))
+    connection.execute(text("ALTER TABLE users DROP COLUMN notification_days"))
+    logger.info(f"Migrated notification schedules of {len(schedules)} users")
+
+
+@migration
+def baseline(connection: Connection, metadata: MetaData) -> None:
+    """Приведение базы данных без версии к первой версии: то, что раньше делал create_db при каждом запуске."""
+    metadata.create_all(connection)
+    migrate_notification_schedule(connection)
+    inspector = inspect(connection)
+    existing = {index['name'] for table in inspector.get_table_names() for index in inspector.get_indexes(table)}
+    missing = [index for table in metadata.sorted_tables for index in table.indexes
+               if index.name in BASELINE_INDEXES and index.name not in existing]
+    if any(index.name == 'uq_dictionaries_level_word' for index in missing):
+        result = connection.execute(text(
+            "DELETE FROM dictionaries WHERE id NOT IN (SELECT MIN(id) FROM dictionaries GROUP BY level, word)"
+        ))
+        logger.info(f"Removed {result.rowcount} duplicate dictionary entries")
+    for index in missing:
+        index.create(connection)
+
+
+@migration
+def use_internal_user_ids(connection: Connection, metadata: MetaData) -> None:
+    """История и краткое содержание разговора записывались с chat_id вместо users.id."""
+    for table in ('user_histories', 'user_summaries'):
+        connection.execute(text(f"DELETE FROM {table} WHERE user_id NOT IN (SELECT chat_id FROM users)"))
+        connection.execute(text(
+            f"UPDATE {table} SET user_id = (SELECT id FROM users WHERE users.chat_id = {table}.user_id)"
+        ))
+
+
+async def migrate(engine: AsyncEngine, metadata: MetaData) -> None:
+    """Обновление схемы базы данных до последней версии."""
+    async with engine.begin() as connection:
+        version = (await connection.execute(text("PRAGMA user_version"))).scalar()
+        tables = await connection.run_sync(lambda sync: inspect(sync).get_table_names())
+        if not tables:
+            # Новая база данных сразу создаётся по моделям последней версии
+            await connection.run_sync(metadata.create_all)
+        else:
+            for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+                logger.info(f"Applying migration {number}: {step.__name__}")
+                await connection.run_sync(step, metadata)
+        await connection.execute(text(f"PRAGMA user_version = {len(MIGRATIONS)}"))
+
@@ -0,0 +1,140 @@
+from typing import Dict, List
+
+from sqlalchemy import Column, Float, ForeignKey, Index, Integer, String, Text, and_, or_, select, update
+from sqlalchemy.orm import declarative_base
+
+Base = declarative_base()
+
+
+# Модели базы данных
+class User(Base):
+    __tablename__ = "users"
+    __table_args__ = (Index('ix_users_notification_minute_mask', 'notification_minute', 'notification_mask'),)
+    id = Column(Integer, primary_key=True, index=True)
+    chat_id = Column(Integer, unique=True, index=True)
+    level = Column(String, index=True)
+    notification_minute = Column(Integer)  # минуты от полуночи UTC
+    notification_mask = Column(Integer, nullable=False, default=0, server_default='0')  # бит i — день DAYS[i] по Москве
+    language = Column(String, default='en')
+    chosen_character = Column(String, default='Lori')
+
+
+class UserHistory(Base):
+    __tablename__ = "user_histories"
+    __table_args__ = (Index('ix_user_histories_user_id_id', 'user_id', 'id'),)
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'))
+    role = Column(String)
+    content = Column(Text)
+
+
+class UserSummary(Base):
+    __tablename__ = "user_summaries"
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    content = Column(Text)
+
+
+class Dictionary(Base):
+    __tablename__ = "dictionaries"
+    __table_args__ = (Index('uq_dictionaries_level_word', 'level', 'word', unique=True),)
+    id = Column(Integer, primary_key=True, index=True)
+    level = Column(String, index=True)
+    word = Column(String, index=True)
+    definition = Column(Text)
+    translation = Column(Text)
+
+
+class WordReview(Base):
+    __tablename__ = "word_reviews"
+    __table_args__ = (Index('ix_word_reviews_user_id_due_at', 'user_id', 'due_at'),)
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    word_id = Column(Integer, ForeignKey('dictionaries.id'), primary_key=True)
+    repetitions = Column(Integer, nullable=False, default=0)
+    interval_days = Column(Float, nullable=False, default=0.0)
+    ease = Column(Float, nullable=False, default=2.5)
+    due_at = Column(Integer, nullable=False)  # unix time, секунды
+
+
+class Setting(Base):
+    __tablename__ = "settings"
+    key = Column(String, primary_key=True)
+    value = Column(Text)
+
+
+class TelegramFile(Base):
+    __tablename__ = "telegram_files"
+    key = Column(String, primary_key=True)
+    file_id = Column(String, nullable=False)
+
+
+class GrammarExercise(Base):
+    __tablename__ = "grammar_exercises"
+    id = Column(Integer, primary_key=True, index=True)
+    level = Column(String, index=True)
+    rule_name = Column(String, index=True)
+    question = Column(Text)
+    answer = Column(Text)
+
+
+# Запросы частых обработчиков; планы их выполнения проверяются в tests/test_query_plans.py
+def user_by_chat_query(chat_id: int):
+    return select(User).filter(User.chat_id == chat_id)
+
+
+def due_reminders_query(minutes_by_day: Dict[int, List[int]]):
+    """Пользователи с временем уведомления из minutes_by_day[day] и включённым днём недели day."""
+    return select(User.chat_id, User.language).where(or_(*(
+        and_(User.notification_minute.in_(minutes), User.notification_mask.op('&')(1 << day) != 0)
+        for day, minutes in minutes_by_day.items()
+    )))
+
+
+def recent_history_query(user_id: int, limit: int):
+    return (
+        select(UserHistory.role, UserHistory.content)
+        .filter(UserHistory.user_id == user_id)
+        .order_by(UserHistory.id.desc())
+        .limit(limit)
+    )
+
+
+def trim_history_statement(user_id: int, keep: int):
+    """Удаление сообщений пользователя старше последних keep."""
+    oldest_kept_id = (
+        select(UserHistory.id)
+        .filter(UserHistory.user_id == user_id)
+        .order_by(UserHistory.id.desc())
+        .limit(1)
+        .offset(keep - 1)
+        .scalar_subquery()
+    )
+    return (
+        UserHistory.__table__.delete()
+        .where(UserHistory.user_id == user_id, UserHistory.id < oldest_kept_id)
+        .returning(UserHistory.id, UserHistory.role, UserHistory.content)
+    )
+
+
+def toggle_day_statement(chat_id: int, bit: int):
+    # Переключение бита одним запросом: (mask | bit) - (mask & bit) — это XOR, которого нет в SQLite
+    mask = User.notification_mask
+    return (
+        update(User).where(User.chat_id == chat_id)
+        .values(notification_mask=mask.op('|')(bit) - mask.op('&')(bit))
+        .returning(User.notification_mask, User.language)
+    )
+
+
+def dictionary_word_query(level: str, word: str):
+    return select(Dictionary).filter(Dictionary.level == level, Dictionary.word == word)
+
+
+def due_review_query(user_id: int, now: int):
+    """Слово с самым ранним наступившим сроком повторения — диапазонный запрос по индексу (user_id, due_at)."""
+    return (
+        select(Dictionary.id, Dictionary.word, Dictionary.translation)
+        .join(WordReview, WordReview.word_id == Dictionary.id)
+        .filter(WordReview.user_id == user_id, WordReview.due_at <= now)
+        .order_by(WordReview.due_at)
+        .limit(1)
+    )
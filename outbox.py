@@ -0,0 +1,190 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
+
+# Очереди отправки: меньшее значение обслуживается раньше
+INTERACTIVE = 0
+BULK = 1
+LANES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+priority: ContextVar[int] = ContextVar("outbox_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def bulk() -> Iterator[None]:
+    """Отправка запросов внутри блока с низким приоритетом (рассылки)."""
+    token = priority.set(BULK)
+    try:
+        yield
+    finally:
+        priority.reset(token)
+
+
+class Pacer:
+    """Ограничение частоты (GCRA): не больше rate событий в секунду, подряд — до burst."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.interval = 1 / rate
+        self.tolerance = self.interval * (max(burst, 1) - 1)
+        self.tat = 0.0  # теоретическое время следующего события
+
+    def delay(self, now: float) -> float:
+        return max(0.0, self.tat - self.tolerance - now)
+
+    def take(self, now: float) -> None:
+        self.tat = max(self.tat, now) + self.interval
+
+    def pause(self, until: float) -> None:
+        self.tat = max(self.tat, until + self.tolerance)
+
+
+class Outbox(BaseRequestMiddleware):
+    """Очередь исходящих запросов к Bot API с учётом лимитов Telegram.
+
+    Запросы с chat_id ждут свободного места в лимите своего чата и в общем лимите бота.
+    Общий лимит выдаётся по приоритету: ответы пользователям обгоняют рассылки.
+    После RetryAfter на указанное время приостанавливается отправка в этот чат, и запрос повторяется.
+    Вся отправка приостанавливается, только если RetryAfter за flood_window секунд пришёл из flood_chats чатов.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: int, max_retries: int = 3,
+                 flood_chats: int = 2, flood_window: float = 10.0) -> None:
+        # Общий лимит без накопления: после простоя сообщения всё равно идут равномерно
+        self.global_pacer = Pacer(global_rate, 1)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.flood_chats = flood_chats
+        self.flood_window = flood_window
+        self._floods: Dict[Any, float] = {}  # время последнего RetryAfter по чатам
+        self._chats: Dict[Any, Pacer] = {}
+        self._prune_at = 1024
+        self._waiting: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._release_task: Optional[asyncio.Task] = None
+        self._latencies: Dict[int, Deque[float]] = {lane: deque(maxlen=1000) for lane in LANES}
+        self.sent = 0
+        self.retried = 0
+        self.gave_up = 0
+        self.chat_pauses = 0
+        self.global_pauses = 0
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+        lane = priority.get()
+        # Номер сохраняется между повторами: повтор не встаёт в конец очереди
+        sequence = next(self._sequence)
+        started = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            await self._wait_chat(chat_id)
+            await self._wait_global(lane, sequence)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    self.gave_up += 1
+                    raise
+                self.retried += 1
+                self._pause(chat_id, e.retry_after)
+                continue
+            self.sent += 1
+            self._latencies[lane].append(time.monotonic() - started)
+            return response
+
+    def _pause(self, chat_id: Any, retry_after: float) -> None:
+        now = time.monotonic()
+        self._floods = {chat: at for chat, at in self._floods.items() if now - at < self.flood_window}
+        self._floods[chat_id] = now
+        if len(self._floods) >= self.flood_chats:
+            logger.warning(f"Flood control in {len(self._floods)} chats, pausing all sends for {retry_after}s")
+            self.global_pauses += 1
+            self.global_pacer.pause(now + retry_after)
+        else:
+            logger.warning(f"Flood control in chat {chat_id}, pausing sends to it for {retry_after}s")
+            self.chat_pauses += 1
+            self._chat_pacer(chat_id, now).pause(now + retry_after)
+
+    def _chat_pacer(self, chat_id: Any, now: float) -> Pacer:
+        pacer = self._chats.get(chat_id)
+        if pacer is None:
+            if len(self._chats) >= self._prune_at:
+                self._prune(now)
+            pacer = self._chats[chat_id] = Pacer(self.chat_rate, self.chat_burst)
+        return pacer
+
+    async def _wait_chat(self, chat_id: Any) -> None:
+        now = time.monotonic()
+        pacer = self._chat_pacer(chat_id, now)
+        delay = pacer.delay(now)
+        # Место занимается сразу, чтобы следующие запросы чата ждали за этим
+        pacer.take(now + delay)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def _prune(self, now: float) -> None:
+        """Удаление чатов, лимит которых полностью восстановился."""
+        self._chats = {chat_id: pacer for chat_id, pacer in self._chats.items() if pacer.tat > now}
+        self._prune_at = max(1024, 2 * len(self._chats))
+
+    async def _wait_global(self, lane: int, sequence: int) -> None:
+        if not self._waiting and not self.global_pacer.delay(time.monotonic()):
+            self.global_pacer.take(time.monotonic())
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (lane, sequence, future))
+        if self._release_task is None or self._release_task.done():
+            self._release_task = asyncio.create_task(self._release())
+        await future
+
+    async def _release(self) -> None:
+        """Выдача мест в общем лимите ожидающим запросам в порядке приоритета."""
+        while self._waiting:
+            delay = self.global_pacer.delay(time.monotonic())
+            if delay:
+                # Пока идёт ожидание, в очередь могут встать запросы с более высоким приоритетом
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiting)
+            if future.done():
+                continue
+            self.global_pacer.take(time.monotonic())
+            future.set_result(None)
+
+    def metrics(self) -> Dict[str, Any]:
+        depth = {name: 0 for name in LANES.values()}
+        for lane, _, future in self._waiting:
+            if not future.done():
+                depth[LANES[lane]] += 1
+        latency = {}
+        for lane, values in self._latencies.items():
+            ordered = sorted(values)
+            latency[LANES[lane]] = {
+                "p50": round(ordered[len(ordered) // 2], 3) if ordered else 0.0,
+                "p95": round(ordered[int(len(ordered) * 0.95)], 3) if ordered else 0.0
+            }
+        return {
+            "queue_depth": depth,
+            "send_latency": latency,
+            "sent": self.sent,
+            "retried": self.retried,
+            "gave_up": self.gave_up,
+            "chat_pauses": self.chat_pauses,
+            "global_pauses": self.global_pauses
+        }
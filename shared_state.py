@@ -0,0 +1,111 @@
+import heapq
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import redis.asyncio as redis
+except ImportError:
+    redis = None
+
+
+class MemorySharedState:
+    """Общее состояние в памяти процесса: для запуска одним процессом."""
+
+    def __init__(self) -> None:
+        self._values: Dict[str, Tuple[Optional[float], str]] = {}
+        # Сроки жизни ключей: записи ключей, которые читаются один раз (счётчики окон, блокировки минут),
+        # удаляются по истечении срока, а не при следующем чтении
+        self._expiries: List[Tuple[float, str]] = []
+
+    def _store(self, key: str, expires_at: Optional[float], value: str) -> None:
+        now = time.monotonic()
+        while self._expiries and self._expiries[0][0] <= now:
+            expired_at, expired_key = heapq.heappop(self._expiries)
+            entry = self._values.get(expired_key)
+            # Ключ мог быть перезаписан с новым сроком после постановки в кучу
+            if entry is not None and entry[0] == expired_at:
+                del self._values[expired_key]
+        self._values[key] = (expires_at, value)
+        if expires_at is not None:
+            heapq.heappush(self._expiries, (expires_at, key))
+
+    def _alive(self, key: str) -> Optional[str]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._values[key]
+            return None
+        return value
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._alive(key)
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        self._store(key, time.monotonic() + ttl if ttl else None, value)
+
+    async def delete(self, key: str) -> None:
+        self._values.pop(key, None)
+
+    async def incr(self, key: str, ttl: int) -> int:
+        """Увеличение счётчика; срок жизни задаётся при создании (окно ограничения частоты)."""
+        current = self._alive(key)
+        if current is None:
+            self._store(key, time.monotonic() + ttl, "1")
+            return 1
+        expires_at, _ = self._values[key]
+        value = int(current) + 1
+        # Срок не меняется, поэтому новая запись в куче не нужна
+        self._values[key] = (expires_at, str(value))
+        return value
+
+    async def acquire_lock(self, key: str, ttl: int) -> bool:
+        """Однократный захват ключа на ttl секунд; False, если его уже захватил кто-то другой."""
+        if self._alive(key) is not None:
+            return False
+        self._store(key, time.monotonic() + ttl, "1")
+        return True
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisSharedState:
+    """Общее состояние в Redis (или совместимом сервере) для нескольких процессов бота."""
+
+    def __init__(self, url: str, prefix: str) -> None:
+        if redis is None:
+            raise RuntimeError("The 'redis' package is required when REDIS_URL is set")
+        self.client = redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        await self.client.set(self.prefix + key, value, ex=ttl)
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(self.prefix + key)
+
+    async def incr(self, key: str, ttl: int) -> int:
+        """Увеличение счётчика; срок жизни задаётся при создании (окно ограничения частоты)."""
+        value = await self.client.incr(self.prefix + key)
+        if value == 1:
+            await self.client.expire(self.prefix + key, ttl)
+        return value
+
+    async def acquire_lock(self, key: str, ttl: int) -> bool:
+        """Однократный захват ключа на ttl секунд; False, если его уже захватил другой процесс."""
+        return bool(await self.client.set(self.prefix + key, "1", ex=ttl, nx=True))
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def create_shared_state(url: Optional[str], prefix: str):
+    """Redis, если задан адрес сервера, иначе состояние в памяти процесса."""
+    if url:
+        return RedisSharedState(url, prefix)
+    return MemorySharedState()
@@ -0,0 +1,38 @@
+from typing import NamedTuple
+
+# Оценки ответа по шкале SM-2
+QUALITY_CORRECT = 4
+QUALITY_WRONG = 1
+
+MIN_EASE = 1.3
+SECONDS_PER_DAY = 24 * 60 * 60
+# Неправильно переведённое слово повторяется в той же сессии
+RELEARN_DELAY_SECONDS = 60
+
+
+class ReviewState(NamedTuple):
+    """Состояние повторения слова пользователем."""
+    repetitions: int = 0
+    interval_days: float = 0.0
+    ease: float = 2.5
+
+
+def review(state: ReviewState, quality: int) -> ReviewState:
+    """Пересчёт состояния слова по алгоритму SM-2 после ответа с оценкой quality (0-5)."""
+    ease = max(MIN_EASE, state.ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    if quality < 3:
+        return ReviewState(repetitions=0, interval_days=0.0, ease=ease)
+    if state.repetitions == 0:
+        interval_days = 1.0
+    elif state.repetitions == 1:
+        interval_days = 6.0
+    else:
+        interval_days = state.interval_days * ease
+    return ReviewState(repetitions=state.repetitions + 1, interval_days=interval_days, ease=ease)
+
+
+def next_due_at(state: ReviewState, now: int) -> int:
+    """Время следующего повторения (unix time, секунды)."""
+    if state.repetitions == 0:
+        return now + RELEARN_DELAY_SECONDS
+    return now + int(state.interval_days * SECONDS_PER_DAY)
@@ -0,0 +1,46 @@
+import logging
+import time
+from typing import AsyncIterator
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+async def send_streamed_reply(bot: Bot, chat_id: int, deltas: AsyncIterator[str], reply_markup: InlineKeyboardMarkup,
+                             edit_interval: float = config.STREAM_EDIT_INTERVAL) -> str:
+    """Показ ответа по мере генерации с редактированием одного сообщения."""
+    started_at = time.monotonic()
+    text = ""
+    shown_text = ""
+    message = None
+    last_edit_at = 0.0
+
+    async for delta in deltas:
+        text += delta
+        # Первые токены показываются сразу, а редактирования ограничены по частоте из-за лимитов Telegram
+        if not text.strip() or (message is not None and time.monotonic() - last_edit_at < edit_interval):
+            continue
+        if message is None:
+            message = await bot.send_message(chat_id, f"{text} …", parse_mode=None)
+            logger.info(f"First tokens for chat {chat_id} shown after {time.monotonic() - started_at:.2f}s")
+        elif text != shown_text:
+            try:
+                await bot.edit_message_text(f"{text} …", chat_id=chat_id, message_id=message.message_id,
+                                            parse_mode=None)
+            except TelegramBadRequest as e:
+                logger.warning(f"Failed to update streamed message for chat {chat_id}: {e}")
+        shown_text = text
+        last_edit_at = time.monotonic()
+
+    text = text.strip()
+    if message is None:
+        await bot.send_message(chat_id, text, parse_mode=None, reply_markup=reply_markup)
+    else:
+        await bot.edit_message_text(text, chat_id=chat_id, message_id=message.message_id, parse_mode=None,
+                                    reply_markup=reply_markup)
+    return text
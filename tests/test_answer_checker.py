@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+from answer_checker import CheckResult, Verdict, bounded_distance, build_known_words, check, compile_answer
+
+
+def damerau_levenshtein(a: str, b: str) -> int:
+    """Полное расстояние (оптимальное выравнивание строк) для сверки с ограниченным вариантом."""
+    rows = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i in range(len(a) + 1):
+        rows[i][0] = i
+    for j in range(len(b) + 1):
+        rows[0][j] = j
+    for i in range(1, len(a) + 1):
+        for j in range(1, len(b) + 1):
+            rows[i][j] = min(rows[i - 1][j] + 1, rows[i][j - 1] + 1, rows[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                rows[i][j] = min(rows[i][j], rows[i - 2][j - 2] + 1)
+    return rows[len(a)][len(b)]
+
+
+@pytest.mark.parametrize("a, b, limit, expected", [
+    ("apple", "apple", 1, 0),
+    ("apple", "aple", 1, 1),
+    ("apple", "appel", 1, 1),
+    ("apple", "apply", 1, 1),
+    ("apple", "apricot", 2, 3),
+    ("beautiful", "beatuiful", 2, 1),
+    ("beautiful", "butiful", 2, 2),
+    ("", "abc", 2, 3),
+    ("abc", "xyz", 1, 2)
+])
+def test_bounded_distance(a, b, limit, expected):
+    assert bounded_distance(a, b, limit) == expected
+
+
+def test_bounded_distance_matches_full_distance_up_to_limit():
+    rng = random.Random(13)
+    for _ in range(2000):
+        a = "".join(rng.choice("abcde") for _ in range(rng.randint(0, 9)))
+        b = "".join(rng.choice("abcde") for _ in range(rng.randint(0, 9)))
+        limit = rng.randint(0, 3)
+        assert bounded_distance(a, b, limit) == min(damerau_levenshtein(a, b), limit + 1), (a, b, limit)
+
+
+@pytest.mark.parametrize("answer, text, expected", [
+    ("She doesn't like coffee", "She doesn't like coffee.", CheckResult(Verdict.EXACT)),
+    ("She doesn't like coffee", "she does not like coffee", CheckResult(Verdict.EXACT)),
+    ("She doesn't like coffee", "doesn't like coffee", CheckResult(Verdict.EXACT)),
+    ("She doesn't like coffee", "She doesn’t like coffee", CheckResult(Verdict.EXACT)),
+    ("She doesn't like coffee", "she doesnt like coffee", CheckResult(Verdict.TYPO, 0)),
+    ("She doesn't like coffee", "she doesn't like cofee", CheckResult(Verdict.TYPO, 3)),
+    ("She doesn't like coffee", "she doesn't likes coffee", CheckResult(Verdict.WRONG, 2)),
+    ("She doesn't like coffee", "she does like coffee", CheckResult(Verdict.WRONG, 3)),
+    ("I am happy", "im happy", CheckResult(Verdict.TYPO, 0)),
+    ("They have written a letter", "they have writen a letter", CheckResult(Verdict.TYPO, 1)),
+    ("They have written a letter", "they have wrote a letter", CheckResult(Verdict.WRONG, 1)),
+    ("He is taller than me", "he is taller then me", CheckResult(Verdict.WRONG, 2)),
+    ("He works", "he work", CheckResult(Verdict.WRONG, 0))
+])
+def test_check(answer, text, expected):
+    assert check(compile_answer(answer), text) == expected
+
+
+def test_words_from_exercises_are_never_typos():
+    known_words = build_known_words(["I like my house", "The horse is brown"])
+    assert check(compile_answer("I like my house", known_words), "I like my horse").verdict is Verdict.WRONG
+    assert check(compile_answer("I like my house"), "I like my horse").verdict is Verdict.TYPO
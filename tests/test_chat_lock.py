@@ -0,0 +1,72 @@
+import asyncio
+import itertools
+import time
+from typing import Dict
+
+from aiogram import Bot, Dispatcher, F
+from aiogram.types import CallbackQuery, Update
+
+from middlewares import ChatLockMiddleware
+
+TAPS_PER_DAY = 3
+
+
+def tap(update_id: int, chat_id: int, day: int) -> Update:
+    return Update(update_id=update_id, callback_query={
+        "id": str(update_id), "chat_instance": "chat", "data": f"day:{day}",
+        "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+        "message": {"message_id": 1, "date": 0, "chat": {"id": chat_id, "type": "private"}, "text": "Days"}
+    })
+
+
+def toggle_dispatcher(masks: Dict[int, int], lock: ChatLockMiddleware = None, delay: float = 0.001) -> Dispatcher:
+    """Диспетчер с обработчиком, который, как toggle_day до атомарного UPDATE, читает маску и записывает её позже."""
+    dp = Dispatcher()
+    if lock is not None:
+        dp.update.outer_middleware(lock)
+
+    @dp.callback_query(F.data.startswith("day:"))
+    async def toggle_day(callback_query: CallbackQuery) -> None:
+        chat_id = callback_query.message.chat.id
+        mask = masks.get(chat_id, 0)
+        await asyncio.sleep(delay)
+        masks[chat_id] = mask ^ (1 << int(callback_query.data.split(":")[1]))
+
+    return dp
+
+
+async def tap_all_days(dp: Dispatcher, chats: int) -> float:
+    bot = Bot("123:ABC")
+    update_ids = itertools.count(1)
+    updates = [tap(next(update_ids), chat_id, day)
+               for chat_id in range(1, chats + 1) for day in range(7) for _ in range(TAPS_PER_DAY)]
+    started = time.perf_counter()
+    await asyncio.gather(*(dp.feed_update(bot, update) for update in updates))
+    elapsed = time.perf_counter() - started
+    await bot.session.close()
+    return elapsed
+
+
+def test_rapid_taps_without_lock_lose_toggles():
+    masks: Dict[int, int] = {}
+    asyncio.run(tap_all_days(toggle_dispatcher(masks), chats=1))
+    assert masks[1] != 0b1111111
+
+
+def test_no_lost_toggles_and_idle_locks_are_removed():
+    masks: Dict[int, int] = {}
+    lock = ChatLockMiddleware()
+    asyncio.run(tap_all_days(toggle_dispatcher(masks, lock), chats=50))
+    # Каждый день переключён нечётное число раз: все дни включены
+    assert masks == {chat_id: 0b1111111 for chat_id in range(1, 51)}
+    assert len(lock) == 0
+
+
+def test_chats_run_concurrently():
+    def run(chats: int) -> float:
+        return asyncio.run(tap_all_days(toggle_dispatcher({}, ChatLockMiddleware(), delay=0.05), chats))
+
+    one_chat = run(1)
+    # Обновления одного чата выполняются по очереди, а чаты — параллельно
+    assert one_chat >= 7 * TAPS_PER_DAY * 0.05
+    assert run(20) < one_chat * 1.5
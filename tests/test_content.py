@@ -0,0 +1,40 @@
+import asyncio
+
+import content
+
+# Раздел, сохранённый при запуске content.py как скрипта: ссылка на __main__.Exercise
+MAIN_EXERCISE_PICKLE = b"\x80\x04c__main__\nExercise\n."
+
+
+def write_bundle_with_section(path: str, name: str, data: bytes) -> None:
+    bundle = content.build_bundle(path, content.SOURCES)
+    sections = {section: bundle.raw(section) for section in content.SOURCES}
+    sections[name] = data
+    packed = content.pack(bundle.sources, sections)
+    with open(path, "wb") as f:
+        f.write(packed)
+
+
+def test_exercises_are_pickled_under_the_content_module(tmp_path):
+    path = str(tmp_path / "content.bundle")
+    content.build_bundle(path, content.SOURCES)
+    raw = content.open_bundle(path).raw("grammar_exercises")
+    assert b"__main__" not in raw and b"content" in raw
+
+
+def test_unreadable_section_is_compiled_from_source_and_bundle_rebuilt(tmp_path):
+    path = str(tmp_path / "content.bundle")
+    write_bundle_with_section(path, "grammar_exercises", MAIN_EXERCISE_PICKLE)
+
+    registry = content.ContentRegistry(path)
+    assert registry.bundle.is_fresh(content.SOURCES)
+    exercises = registry.grammar_exercises
+    assert exercises and all(isinstance(exercise, content.Exercise)
+                             for rules in exercises.values() for items in rules.values() for exercise in items)
+    assert not registry.bundle.is_fresh(content.SOURCES)
+
+    # Следующая проверка наблюдателя пересобирает пакет, не перенося из него нечитаемый раздел
+    assert asyncio.run(registry.reload_if_changed())
+    assert registry.grammar_exercises == exercises and not registry.bundle.broken
+    rebuilt = content.open_bundle(path)
+    assert rebuilt.grammar_exercises == exercises and not rebuilt.broken
@@ -0,0 +1,131 @@
+import asyncio
+
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import MetaData, event
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from fsm_storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=42, user_id=42)
+
+
+class Practice(StatesGroup):
+    answering = State()
+
+
+async def open_storage(database_url: str, flush_delay: float = 0.01):
+    engine = create_async_engine(database_url)
+    metadata = MetaData()
+    storage = SQLiteStorage(engine, metadata, flush_delay=flush_delay)
+    async with engine.begin() as connection:
+        await connection.run_sync(metadata.create_all)
+    return engine, storage
+
+
+def test_state_survives_restart(tmp_path):
+    database_url = f"sqlite+aiosqlite:///{tmp_path / 'bot.db'}"
+
+    async def write() -> None:
+        engine, storage = await open_storage(database_url)
+        await storage.set_state(KEY, Practice.answering)
+        await storage.set_data(KEY, {"exercise_index": 3, "current_exercise": {"question": "Где?", "answer": "at"}})
+        await storage.close()
+        await engine.dispose()
+
+    async def read():
+        engine, storage = await open_storage(database_url)
+        try:
+            return await storage.get_state(KEY), await storage.get_data(KEY)
+        finally:
+            await storage.close()
+            await engine.dispose()
+
+    asyncio.run(write())
+    state, data = asyncio.run(read())
+    assert state == Practice.answering.state
+    assert data == {"exercise_index": 3, "current_exercise": {"question": "Где?", "answer": "at"}}
+
+
+def test_cleared_state_is_deleted(tmp_path):
+    database_url = f"sqlite+aiosqlite:///{tmp_path / 'bot.db'}"
+
+    async def run():
+        engine, storage = await open_storage(database_url)
+        await storage.set_state(KEY, Practice.answering)
+        await storage.set_data(KEY, {"exercise_index": 1})
+        await storage.flush()
+        await storage.set_state(KEY, None)
+        await storage.set_data(KEY, {})
+        await storage.close()
+        async with engine.connect() as connection:
+            rows = (await connection.execute(storage.table.select())).all()
+        await engine.dispose()
+        return rows
+
+    assert asyncio.run(run()) == []
+
+
+def test_rapid_updates_are_written_once(tmp_path):
+    async def run() -> int:
+        engine, storage = await open_storage(f"sqlite+aiosqlite:///{tmp_path / 'bot.db'}", flush_delay=0.05)
+        writes = []
+
+        @event.listens_for(engine.sync_engine, "before_cursor_execute")
+        def count_writes(connection, cursor, statement, *args) -> None:
+            if "fsm_states" in statement and not statement.startswith("SELECT"):
+                writes.append(statement)
+
+        # Как в send_practice_exercise: несколько update_data подряд в одном обработчике
+        await storage.set_state(KEY, Practice.answering)
+        for index in range(5):
+            await storage.update_data(KEY, {"exercise_index": index})
+        await asyncio.sleep(0.2)
+        await storage.close()
+        await engine.dispose()
+        return len(writes)
+
+    assert asyncio.run(run()) == 1
+
+
+def test_close_during_pending_flush_keeps_last_writes(tmp_path):
+    database_url = f"sqlite+aiosqlite:///{tmp_path / 'bot.db'}"
+
+    async def write(yields: int) -> None:
+        engine, storage = await open_storage(database_url, flush_delay=0)
+        await storage.set_state(KEY, Practice.answering)
+        # Отложенная запись успевает начать flush и забрать ключи из буфера
+        for _ in range(yields):
+            await asyncio.sleep(0)
+        await storage.close()
+        await engine.dispose()
+
+    async def read():
+        engine, storage = await open_storage(database_url)
+        try:
+            return await storage.get_state(KEY)
+        finally:
+            await storage.close()
+            await engine.dispose()
+
+    for yields in range(6):
+        asyncio.run(write(yields))
+        assert asyncio.run(read()) == Practice.answering.state
+        (tmp_path / 'bot.db').unlink()
+
+
+def test_cancelled_flush_is_retried(tmp_path):
+    async def run():
+        engine, storage = await open_storage(f"sqlite+aiosqlite:///{tmp_path / 'bot.db'}", flush_delay=0)
+        await storage.set_state(KEY, Practice.answering)
+        for _ in range(3):
+            await asyncio.sleep(0)
+        storage._flush_task.cancel()
+        await asyncio.gather(storage._flush_task, return_exceptions=True)
+        await storage.close()
+        async with engine.connect() as connection:
+            rows = (await connection.execute(storage.table.select())).all()
+        await engine.dispose()
+        return rows
+
+    assert [row.state for row in asyncio.run(run())] == [Practice.answering.state]
@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+from aiohttp import web
+
+import config
+import gateway
+
+RESPONSE_DELAY = 0.5
+
+
+async def chat_completions(request: web.Request) -> web.Response:
+    """Медленная модель: каждый ответ генерируется RESPONSE_DELAY секунд."""
+    body = await request.json()
+    await asyncio.sleep(RESPONSE_DELAY)
+    return web.json_response({
+        "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": body["model"],
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": f" Reply to {body['messages'][-1]['content']} "}}]
+    })
+
+
+async def run_turns(count: int, monkeypatch) -> float:
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    monkeypatch.setattr(config, "OPENAI_BASE_URL", f"http://127.0.0.1:{port}/v1")
+    monkeypatch.setattr(config, "PROXY_API_KEY", "test")
+    try:
+        started = time.perf_counter()
+        replies = await asyncio.gather(*(
+            gateway.complete_chat([{"role": "user", "content": f"turn {turn}"}]) for turn in range(count)
+        ))
+        elapsed = time.perf_counter() - started
+        assert replies == [f"Reply to turn {turn}" for turn in range(count)]
+        return elapsed
+    finally:
+        await gateway.close()
+        await runner.cleanup()
+
+
+def test_concurrent_turns_take_about_as_long_as_one(monkeypatch):
+    # Больше одновременных разговоров, чем соединений в пуле, ждали бы очереди
+    count = config.OPENAI_MAX_CONNECTIONS
+    elapsed = asyncio.run(run_turns(count, monkeypatch))
+    assert RESPONSE_DELAY <= elapsed < RESPONSE_DELAY * 2
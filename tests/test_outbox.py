@@ -0,0 +1,120 @@
+import asyncio
+import time
+from typing import Dict, List, Set, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import web
+
+from outbox import Outbox, bulk
+
+
+class FakeBotAPI:
+    """Bot API с лимитами Telegram: global_rate сообщений в секунду и 1 в секунду на чат (подряд до 3)."""
+
+    def __init__(self, global_rate: int, flooded_chats: Set[int] = frozenset()) -> None:
+        self.global_rate = global_rate
+        self.flooded_chats = set(flooded_chats)  # первый запрос в эти чаты получает RetryAfter
+        self.sends: List[Tuple[float, int]] = []
+        self.floods = 0
+        self._chat_tat: Dict[int, float] = {}
+
+    async def handle(self, request: web.Request) -> web.Response:
+        data = await request.post()
+        chat_id = int(data["chat_id"])
+        now = time.monotonic()
+        recent = sum(1 for sent_at, _ in self.sends if now - sent_at < 1.0)
+        tat = self._chat_tat.get(chat_id, 0.0)
+        if chat_id in self.flooded_chats or recent >= self.global_rate or tat - 2.0 > now:
+            self.flooded_chats.discard(chat_id)
+            self.floods += 1
+            return web.json_response({"ok": False, "error_code": 429, "description": "Too Many Requests",
+                                      "parameters": {"retry_after": 1}})
+        self.sends.append((now, chat_id))
+        self._chat_tat[chat_id] = max(tat, now) + 1.0
+        return web.json_response({"ok": True, "result": {
+            "message_id": len(self.sends), "date": 0, "chat": {"id": chat_id, "type": "private"}, "text": data["text"]
+        }})
+
+
+async def run_with_api(api: FakeBotAPI, outbox: Outbox, scenario) -> None:
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    bot = Bot("123:ABC", session=AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{port}")))
+    bot.session.middleware(outbox)
+    try:
+        await scenario(bot)
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
+
+
+def test_broadcast_stays_within_limits_and_replies_overtake_it():
+    api = FakeBotAPI(global_rate=30)
+    outbox = Outbox(global_rate=25, chat_rate=1.0, chat_burst=3)
+    latencies = []
+
+    async def scenario(bot: Bot) -> None:
+        async def remind(chat_id: int) -> None:
+            with bulk():
+                await bot.send_message(chat_id, "reminder")
+
+        async def reply() -> None:
+            await asyncio.sleep(0.5)
+            started = time.monotonic()
+            await bot.send_message(999, "reply")
+            latencies.append(time.monotonic() - started)
+
+        await asyncio.gather(*(remind(chat_id) for chat_id in range(1, 61)), reply())
+
+    asyncio.run(run_with_api(api, outbox, scenario))
+    assert api.floods == 0
+    assert len(api.sends) == 61
+    # Рассылка занимает больше двух секунд, ответ не ждёт её окончания
+    assert latencies[0] < 0.3
+
+
+def test_retry_after_in_one_chat_pauses_only_that_chat():
+    api = FakeBotAPI(global_rate=30, flooded_chats={1})
+    outbox = Outbox(global_rate=25, chat_rate=1.0, chat_burst=3)
+    finished = {}
+
+    async def scenario(bot: Bot) -> None:
+        async def send(chat_id: int, delay: float) -> None:
+            await asyncio.sleep(delay)
+            started = time.monotonic()
+            await bot.send_message(chat_id, "hello")
+            finished[chat_id] = time.monotonic() - started
+
+        await asyncio.gather(send(1, 0), send(2, 0.2))
+
+    asyncio.run(run_with_api(api, outbox, scenario))
+    assert outbox.chat_pauses == 1 and outbox.global_pauses == 0
+    assert finished[1] >= 1.0
+    assert finished[2] < 0.3
+
+
+def test_retry_after_in_several_chats_pauses_all_sends():
+    api = FakeBotAPI(global_rate=30, flooded_chats={1, 2})
+    outbox = Outbox(global_rate=25, chat_rate=1.0, chat_burst=3, flood_chats=2)
+    finished = {}
+
+    async def scenario(bot: Bot) -> None:
+        async def send(chat_id: int, delay: float) -> None:
+            await asyncio.sleep(delay)
+            started = time.monotonic()
+            await bot.send_message(chat_id, "hello")
+            finished[chat_id] = time.monotonic() - started
+
+        await asyncio.gather(send(1, 0), send(2, 0), send(3, 0.2))
+
+    asyncio.run(run_with_api(api, outbox, scenario))
+    assert outbox.chat_pauses == 1 and outbox.global_pauses == 1
+    assert finished[3] >= 0.5
+    assert sorted(chat_id for _, chat_id in api.sends) == [1, 2, 3]
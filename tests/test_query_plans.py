@@ -0,0 +1,68 @@
+import asyncio
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+
+import config
+import migrations
+import models
+
+# Как в bot.py: пары вопрос-ответ
+HISTORY_LIMIT = config.MAX_HISTORY_LENGTH * 2
+
+
+def hot_queries() -> Dict[str, Any]:
+    """Запросы частых обработчиков с типичными параметрами."""
+    return {
+        "user by chat": models.user_by_chat_query(1),
+        "due reminders, one day": models.due_reminders_query({0: [600]}),
+        # Догон пропущенных минут через полночь: условие по нескольким дням недели
+        "due reminders, several days": models.due_reminders_query({0: [1438, 1439], 1: [0, 1]}),
+        "recent history": models.recent_history_query(1, HISTORY_LIMIT),
+        "trim history": models.trim_history_statement(1, HISTORY_LIMIT),
+        "toggle day": models.toggle_day_statement(1, 1 << 3),
+        "dictionary word": models.dictionary_word_query('A1-A2', 'Apple'),
+        "due review": models.due_review_query(1, 0)
+    }
+
+
+async def find_table_scans(connection: AsyncConnection, queries: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """Запросы, план которых (EXPLAIN QUERY PLAN) читает таблицу целиком, а не ищет по индексу."""
+    scans = []
+    for name, query in queries.items():
+        sql = str(query.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+        for row in await connection.execute(text(f"EXPLAIN QUERY PLAN {sql}")):
+            detail = row[-1]
+            if detail.startswith("SCAN ") and "CONSTANT ROW" not in detail:
+                scans.append((name, detail))
+    return scans
+
+
+async def plan_scans(database_url: str) -> List[Tuple[str, str]]:
+    engine = create_async_engine(database_url)
+    try:
+        await migrations.migrate(engine, models.Base.metadata)
+        async with engine.connect() as connection:
+            return await find_table_scans(connection, hot_queries())
+    finally:
+        await engine.dispose()
+
+
+def test_hot_queries_use_indexes(tmp_path):
+    assert asyncio.run(plan_scans(f"sqlite+aiosqlite:///{tmp_path / 'bot.db'}")) == []
+
+
+def test_find_table_scans_reports_unindexed_query(tmp_path):
+    async def scan_by_language() -> List[Tuple[str, str]]:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'bot.db'}")
+        try:
+            await migrations.migrate(engine, models.Base.metadata)
+            async with engine.connect() as connection:
+                query = select(models.User).where(models.User.language == 'en')
+                return await find_table_scans(connection, {"by language": query})
+        finally:
+            await engine.dispose()
+
+    assert [name for name, _ in asyncio.run(scan_by_language())] == ["by language"]
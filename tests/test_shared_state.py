@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import pytest
+
+from shared_state import MemorySharedState, RedisSharedState
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def redis_states(count: int):
+    """Несколько процессов бота с общим сервером Redis."""
+    server = fakeredis.FakeServer()
+    states = []
+    for _ in range(count):
+        state = RedisSharedState("redis://localhost:6379/0", "englishai:")
+        state.client = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+        states.append(state)
+    return states
+
+
+async def close_all(states) -> None:
+    for state in states:
+        await state.close()
+
+
+def test_redis_lock_is_granted_once():
+    async def run():
+        states = redis_states(3)
+        granted = await asyncio.gather(*(state.acquire_lock("reminders:1000", ttl=60) for state in states * 2))
+        await close_all(states)
+        return granted
+
+    assert sorted(asyncio.run(run())) == [False] * 5 + [True]
+
+
+def test_redis_counter_expires_with_its_window():
+    async def run():
+        first, second = redis_states(2)
+        counts = [await first.incr("rate:talk:1", ttl=1), await second.incr("rate:talk:1", ttl=1),
+                  await first.incr("rate:talk:1", ttl=1)]
+        await asyncio.sleep(1.2)
+        counts.append(await second.incr("rate:talk:1", ttl=1))
+        await close_all([first, second])
+        return counts
+
+    assert asyncio.run(run()) == [1, 2, 3, 1]
+
+
+def test_redis_file_id_is_shared_between_processes():
+    async def run():
+        first, second = redis_states(2)
+        await first.set("file_id:voice:abc", "AwACAgIAAxk")
+        seen = await second.get("file_id:voice:abc")
+        await second.delete("file_id:voice:abc")
+        gone = await first.get("file_id:voice:abc")
+        raw = await first.client.keys("*")
+        await close_all([first, second])
+        return seen, gone, raw
+
+    seen, gone, raw = asyncio.run(run())
+    assert seen == "AwACAgIAAxk" and gone is None and raw == []
+
+
+def test_memory_state_evicts_expired_keys_on_write(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+
+    async def run():
+        state = MemorySharedState()
+        for minute in range(1000):
+            await state.acquire_lock(f"reminders:{minute}", ttl=60)
+            await state.incr(f"rate:talk:{minute}", ttl=60)
+        await state.set("file_id:voice:abc", "AwACAgIAAxk")
+        # Ключ перезаписан с более поздним сроком: старая запись в куче не должна его удалить
+        await state.set("dictionary:version", "1", ttl=10)
+        await state.set("dictionary:version", "2", ttl=120)
+        assert len(state._values) == 2002
+        now[0] += 61
+        await state.set("trigger", "1")
+        return state
+
+    state = asyncio.run(run())
+    assert set(state._values) == {"file_id:voice:abc", "dictionary:version", "trigger"}
+    assert asyncio.run(state.get("dictionary:version")) == "2"
+    assert asyncio.run(state.acquire_lock("reminders:0", ttl=60))
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import time
+from typing import Any, Dict, List
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from aiohttp import web
+
+import config
+import gateway
+import streaming
+
+DELTAS = ["Hello", " there", "!", " How", " are", " you", " doing", " today", "?", " Tell", " me", " more."]
+DELTA_INTERVAL = 0.1
+EDIT_INTERVAL = 0.35
+
+
+class FakeServers:
+    """Потоковая модель (SSE) и Bot API, записывающий запросы бота со временем их получения."""
+
+    def __init__(self) -> None:
+        self.first_delta_at = 0.0
+        self.requests: List[Dict[str, Any]] = []
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        assert body["stream"] is True
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for index, delta in enumerate(DELTAS):
+            if index:
+                await asyncio.sleep(DELTA_INTERVAL)
+            else:
+                self.first_delta_at = time.monotonic()
+            chunk = {"id": "chatcmpl-test", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                     "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def bot_api(self, request: web.Request) -> web.Response:
+        data = dict(await request.post())
+        method = request.match_info["method"]
+        self.requests.append({"method": method, "at": time.monotonic(), **data})
+        return web.json_response({"ok": True, "result": {
+            "message_id": 1, "date": 0, "chat": {"id": int(data["chat_id"]), "type": "private"}, "text": data["text"]
+        }})
+
+
+async def stream_reply(servers: FakeServers, monkeypatch) -> str:
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", servers.chat_completions)
+    app.router.add_post("/bot{token}/{method}", servers.bot_api)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    monkeypatch.setattr(config, "OPENAI_BASE_URL", f"http://127.0.0.1:{port}/v1")
+    monkeypatch.setattr(config, "PROXY_API_KEY", "test")
+    bot = Bot("123:ABC", session=AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{port}")))
+    markup = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="Back", callback_data="back")]])
+    try:
+        deltas = gateway.stream_chat([{"role": "user", "content": "Hi"}])
+        return await streaming.send_streamed_reply(bot, 42, deltas, markup, edit_interval=EDIT_INTERVAL)
+    finally:
+        await bot.session.close()
+        await gateway.close()
+        await runner.cleanup()
+
+
+def test_streamed_reply_is_shown_at_once_and_edited_at_a_limited_rate(monkeypatch):
+    servers = FakeServers()
+    text = asyncio.run(stream_reply(servers, monkeypatch))
+    assert text == "".join(DELTAS)
+
+    first, *edits = servers.requests
+    assert first["method"] == "sendMessage" and first["text"] == "Hello …"
+    assert first["at"] - servers.first_delta_at < DELTA_INTERVAL
+
+    assert edits and all(request["method"] == "editMessageText" for request in edits)
+    *partial, final = edits
+    updates = [first] + partial
+    assert all(later["at"] - earlier["at"] >= EDIT_INTERVAL for earlier, later in zip(updates, updates[1:]))
+    assert all("reply_markup" not in request for request in updates)
+
+    assert final["text"] == "".join(DELTAS)
+    assert json.loads(final["reply_markup"]) == {"inline_keyboard": [[{"text": "Back", "callback_data": "back"}]]}
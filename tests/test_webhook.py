@@ -0,0 +1,104 @@
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.types import Update
+from aiohttp.test_utils import TestClient, TestServer
+
+from webhook import SECRET_HEADER, UpdateQueue, create_app
+
+SECRET = "secret"
+
+
+class StubDispatcher:
+    """Диспетчер, который записывает порядок обработки и ждёт release (или delay секунд) на каждом обновлении."""
+
+    def __init__(self, delay: float = 0.0, release: Optional[asyncio.Event] = None) -> None:
+        self.delay = delay
+        self.release = release
+        self.handled: Dict[int, List[int]] = {}
+
+    async def feed_update(self, bot: Bot, update: Update, **kwargs) -> None:
+        if self.release is not None:
+            await self.release.wait()
+        await asyncio.sleep(self.delay)
+        self.handled.setdefault(update.message.chat.id, []).append(update.update_id)
+
+
+def message_update(update_id: int, chat_id: int) -> dict:
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": "hi", "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "User"}
+    }}
+
+
+async def with_client(queue: UpdateQueue, scenario) -> None:
+    client = TestClient(TestServer(create_app(queue, "/webhook", SECRET)))
+    await client.start_server()
+    try:
+        await scenario(client)
+    finally:
+        await client.close()
+        await queue.bot.session.close()
+
+
+async def post(client: TestClient, update: dict) -> int:
+    response = await client.post("/webhook", json=update, headers={SECRET_HEADER: SECRET})
+    return response.status
+
+
+def test_replayed_updates_keep_per_chat_order():
+    chats, per_chat, delay = 50, 20, 0.005
+    dispatcher = StubDispatcher(delay=delay)
+    queue = UpdateQueue(dispatcher, Bot("123:ABC"), concurrency=64, queue_size=chats * per_chat)
+    elapsed = []
+
+    async def scenario(client: TestClient) -> None:
+        # Обновления разных чатов чередуются, как в реальном потоке
+        updates = [message_update(number * chats + chat_id, chat_id)
+                   for number in range(per_chat) for chat_id in range(1, chats + 1)]
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(post(client, update) for update in updates))
+        await queue.stop(timeout=30)
+        elapsed.append(time.perf_counter() - started)
+        assert set(statuses) == {200}
+
+    asyncio.run(with_client(queue, scenario))
+    assert queue.processed == chats * per_chat and queue.failed == 0
+    assert dispatcher.handled == {
+        chat_id: [number * chats + chat_id for number in range(per_chat)] for chat_id in range(1, chats + 1)
+    }
+    # Чаты обрабатываются параллельно: намного быстрее, чем все обновления по очереди
+    assert elapsed[0] < chats * per_chat * delay / 4
+
+
+def test_full_queue_rejects_updates_and_reports_metrics():
+    release = asyncio.Event()
+    dispatcher = StubDispatcher(release=release)
+    queue = UpdateQueue(dispatcher, Bot("123:ABC"), concurrency=1, queue_size=3)
+
+    async def scenario(client: TestClient) -> None:
+        assert await post(client, message_update(1, 1)) == 200
+        assert await post(client, message_update(2, 1)) == 200
+        assert await post(client, message_update(3, 2)) == 200
+        assert await post(client, message_update(4, 3)) == 503
+        unauthorized = await client.post("/webhook", json=message_update(5, 4))
+        assert unauthorized.status == 401
+
+        await asyncio.sleep(0.1)
+        metrics = await (await client.get("/metrics")).json()
+        assert metrics["in_flight"] == 1
+        assert metrics["queue_depth"] == 2
+        assert metrics["max_chat_depth"] == 1
+        assert metrics["oldest_update_age"] >= 0.1
+        assert metrics["rejected"] == 1
+
+        release.set()
+        await queue.stop(timeout=5)
+        metrics = await (await client.get("/metrics")).json()
+        assert metrics["queue_depth"] == 0 and metrics["oldest_update_age"] == 0.0
+        assert metrics["processed"] == 3
+
+    asyncio.run(with_client(queue, scenario))
+    assert dispatcher.handled == {1: [1, 2], 2: [3]}
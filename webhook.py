@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import signal
+import time
+from collections import deque
+from contextlib import suppress
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import Update
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class UpdateQueue:
+    """Ограниченная очередь обновлений: каждое обновление обрабатывается отдельной задачей.
+
+    У каждого чата своя очередь: обновления одного чата обрабатываются по порядку, поэтому переходы FSM
+    не перемешиваются, а долгий обработчик одного чата не задерживает другие. Одновременно обрабатываются
+    обновления не более чем concurrency чатов, остальные ждут в очереди не длиннее queue_size.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, concurrency: int, queue_size: int,
+                 workflow_data: Optional[Dict[str, Any]] = None) -> None:
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.workflow_data = workflow_data or {}
+        # Ожидающие обновления чатов со временем постановки в очередь
+        self._pending: Dict[int, Deque[Tuple[float, Update]]] = {}
+        # Чаты с ожидающими обновлениями, для которых ещё нет задачи, в порядке очереди
+        self._ready: Deque[int] = deque()
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._size = 0
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self.processed = 0
+        self.rejected = 0
+        self.failed = 0
+
+    @staticmethod
+    def chat_key(update: Update) -> int:
+        chat = UserContextMiddleware.resolve_event_context(update).chat
+        return chat.id if chat else update.update_id
+
+    def put(self, update: Update) -> bool:
+        """Постановка обновления в очередь без ожидания; False, если очередь заполнена."""
+        if self._size >= self.queue_size:
+            self.rejected += 1
+            return False
+        key = self.chat_key(update)
+        updates = self._pending.setdefault(key, deque())
+        updates.append((time.monotonic(), update))
+        self._size += 1
+        self._drained.clear()
+        if len(updates) == 1 and key not in self._tasks:
+            self._ready.append(key)
+            self._schedule()
+        return True
+
+    def _schedule(self) -> None:
+        while self._ready and len(self._tasks) < self.concurrency:
+            key = self._ready.popleft()
+            self._tasks[key] = asyncio.create_task(self._process(key))
+
+    async def _process(self, key: int) -> None:
+        _, update = self._pending[key].popleft()
+        try:
+            await self.dispatcher.feed_update(self.bot, update, **self.workflow_data)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Error processing update {update.update_id}: {e}")
+        finally:
+            del self._tasks[key]
+            self._size -= 1
+            # Следующее обновление чата встаёт в конец очереди, чтобы чаты с длинной очередью не занимали место
+            if self._pending[key]:
+                self._ready.append(key)
+            else:
+                del self._pending[key]
+            self._schedule()
+            if not self._size:
+                self._drained.set()
+
+    async def stop(self, timeout: float) -> None:
+        """Обработка уже принятых обновлений и отмена тех, что не успели завершиться."""
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self._drained.wait(), timeout)
+        self._ready.clear()
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def metrics(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        oldest = min((updates[0][0] for updates in self._pending.values() if updates), default=None)
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": len(self._tasks),
+            "queue_depth": self._size - len(self._tasks),
+            "max_chat_depth": max((len(updates) for updates in self._pending.values()), default=0),
+            "oldest_update_age": round(now - oldest, 3) if oldest is not None else 0.0,
+            "processed": self.processed,
+            "rejected": self.rejected,
+            "failed": self.failed
+        }
+
+
+def create_app(updates: UpdateQueue, path: str, secret: Optional[str],
+               metrics: Optional[Dict[str, Callable[[], Dict[str, Any]]]] = None) -> web.Application:
+    """Приложение aiohttp: приём обновлений Telegram и метрики очереди (и дополнительные метрики из metrics)."""
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if secret and request.headers.get(SECRET_HEADER) != secret:
+            return web.Response(status=401)
+        update = Update.model_validate(await request.json(), context={"bot": updates.bot})
+        # Telegram повторит обновление позже, если очередь переполнена
+        if not updates.put(update):
+            return web.Response(status=503)
+        return web.Response()
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.json_response({**updates.metrics(), **{name: source() for name, source in (metrics or {}).items()}})
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    app.router.add_get("/metrics", handle_metrics)
+    return app
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot, url: str, path: str, host: str, port: int,
+                      secret: Optional[str], concurrency: int, queue_size: int, drain_timeout: float = 10.0,
+                      metrics: Optional[Dict[str, Callable[[], Dict[str, Any]]]] = None) -> None:
+    """Запуск бота в режиме вебхука до получения SIGINT/SIGTERM."""
+    workflow_data = {"dispatcher": dispatcher, "bots": [bot], **dispatcher.workflow_data}
+    updates = UpdateQueue(dispatcher, bot, concurrency, queue_size, workflow_data)
+    runner = web.AppRunner(create_app(updates, path, secret, metrics))
+    await runner.setup()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(signal_number, stop.set)
+
+    await dispatcher.emit_startup(bot=bot, **workflow_data)
+    try:
+        await web.TCPSite(runner, host, port).start()
+        await bot.set_webhook(url + path, secret_token=secret,
+                              allowed_updates=dispatcher.resolve_used_update_types())
+        logger.info(f"Webhook is listening on {host}:{port}{path}")
+        await stop.wait()
+    finally:
+        # Новые обновления больше не принимаются, принятые обрабатываются до конца
+        await runner.cleanup()
+        await updates.stop(drain_timeout)
+        await dispatcher.emit_shutdown(bot=bot, **workflow_data)
+        await bot.session.close()
@@ -0,0 +1,49 @@
+import random
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+WordEntry = Tuple[int, str, str]
+
+
+class WordPool:
+    """Слова словаря по уровням в компактных массивах для случайной выборки без запросов к БД."""
+
+    def __init__(self) -> None:
+        self._ids: Dict[str, array] = {}
+        self._words: Dict[str, List[str]] = {}
+        self._translations: Dict[str, List[str]] = {}
+
+    def load(self, rows: Iterable[Tuple[int, str, str, str]]) -> None:
+        """Полная загрузка пула из строк (id, level, word, translation)."""
+        ids: Dict[str, array] = {}
+        words: Dict[str, List[str]] = {}
+        translations: Dict[str, List[str]] = {}
+        for word_id, level, word, translation in rows:
+            ids.setdefault(level, array('q')).append(word_id)
+            words.setdefault(level, []).append(word)
+            translations.setdefault(level, []).append(translation)
+        self._ids, self._words, self._translations = ids, words, translations
+
+    def add(self, level: str, word_id: int, word: str, translation: str) -> None:
+        """Добавление нового слова в пул уровня."""
+        self._ids.setdefault(level, array('q')).append(word_id)
+        self._words.setdefault(level, []).append(word)
+        self._translations.setdefault(level, []).append(translation)
+
+    def size(self, level: str) -> int:
+        return len(self._ids.get(level, ()))
+
+    def _entry(self, level: str, index: int) -> WordEntry:
+        return self._ids[level][index], self._words[level][index], self._translations[level][index]
+
+    def choice(self, level: str) -> Optional[WordEntry]:
+        """Случайное слово уровня или None, если слов нет."""
+        size = self.size(level)
+        if not size:
+            return None
+        return self._entry(level, random.randrange(size))
+
+    def sample(self, level: str, k: int) -> List[WordEntry]:
+        """Несколько разных случайных слов уровня."""
+        size = self.size(level)
+        return [self._entry(level, index) for index in random.sample(range(size), min(k, size))]